@@ -6,7 +6,7 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import os, yaml, pwd, hashlib, traceback
-from fabric.api import execute, hide
+from fabric.api import hide
 from tqdm import tqdm
 from urlparse import urlparse
 
@@ -21,6 +21,7 @@ from sdscli.os_utils import validate_dir
 from sdscli.prompt_utils import print_component_header
 
 from . import fabfile as fab
+from .fabfile import execute
 
 
 #def remove_job(args):
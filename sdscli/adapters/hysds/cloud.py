@@ -6,7 +6,6 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import os, json, pkgutil, traceback
-from fabric.api import execute, hide
 
 from prompt_toolkit.shortcuts import prompt, print_tokens
 from prompt_toolkit.styles import style_from_dict
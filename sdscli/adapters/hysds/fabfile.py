@@ -5,14 +5,14 @@ from __future__ import unicode_literals
 from __future__ import absolute_import
 from __future__ import print_function
 
-import os, re, yaml, json, requests
-from copy import deepcopy
+import os, sys, re, io, json, time, uuid, tarfile, hashlib, subprocess, requests
 from fabric.api import run, cd, put, sudo, prefix, env, settings, hide
+from fabric.api import execute as fabric_execute
 from fabric.contrib.files import upload_template, exists, append
 from fabric.contrib.project import rsync_project
 
 from sdscli.log_utils import logger
-from sdscli.conf_utils import get_user_config_path, get_user_files_path
+from sdscli.conf_utils import get_user_config_path, get_user_files_path, load_yaml
 from sdscli.prompt_utils import highlight, blink
 
 
@@ -23,66 +23,11 @@ extra_opts = "-k"
 # repo regex
 repo_re = re.compile(r'.+//.*?/(.*?)/(.*?)(?:\.git)?$')
 
-# define private EC2 IP addresses for infrastructure hosts
+# user's SDS config and derived settings; populated by setup_env() on first remote execution
 context = {}
 this_dir = os.path.dirname(os.path.abspath(__file__))
-sds_cfg = get_user_config_path()
-if not os.path.isfile(sds_cfg):
-    raise RuntimeError("SDS configuration file doesn't exist. Run 'sds configure'.")
-with open(sds_cfg) as f:
-    context = yaml.load(f)
-
-# define and build groups to reduce redundancy in defining roles
-
-# mozart hosts
-mozart_host = '%s' % context['MOZART_PVT_IP']
-mozart_rabbit_host = '%s' % context['MOZART_RABBIT_PVT_IP']
-mozart_redis_host = '%s' % context['MOZART_REDIS_PVT_IP']
-mozart_es_host = '%s' % context['MOZART_ES_PVT_IP']
-
-# metrics host
-metrics_host = '%s' % context['METRICS_PVT_IP']
-metrics_redis_host = '%s' % context['METRICS_REDIS_PVT_IP']
-metrics_es_host = '%s' % context['METRICS_ES_PVT_IP']
-
-# grq host
-grq_host = '%s' % context['GRQ_PVT_IP']
-grq_es_host = '%s' % context['GRQ_ES_PVT_IP']
-
-# factotum host
-factotum_host = '%s' % context['FACTOTUM_PVT_IP']
-
-# continuous integration host
-ci_host = '%s' % context['CI_PVT_IP']
-
-# all verdi hosts
-verdi_hosts = [
-    '%s' % context['VERDI_PVT_IP'],
-]
-if context.get('OTHER_VERDI_HOSTS', None) is not None:
-    verdi_hosts.extend([i['VERDI_PVT_IP'] for i in context['OTHER_VERDI_HOSTS'] if i['VERDI_PVT_IP'] is not None])
-
-# define roles
-env.roledefs = {
-    'mozart': [ mozart_host ],
-    'mozart-rabbit': [ mozart_rabbit_host ],
-    'mozart-redis': [ mozart_redis_host ],
-    'mozart-es': [ mozart_es_host ],
-    'metrics': [ metrics_host ],
-    'metrics-redis': [ metrics_redis_host ],
-    'metrics-es': [ metrics_es_host ],
-    'grq': [ grq_host ],
-    'grq-es': [ grq_es_host ],
-    'factotum': [ factotum_host ],
-    'ci': [ ci_host ],
-    'verdi': verdi_hosts,
-}
-
-# define key file
-env.key_filename = context['KEY_FILENAME']
-if not os.path.isfile(env.key_filename):
-    raise RuntimeError("SSH key filename %s doesn't exist. " % env.key_filename +
-                       "Run 'ssh-keygen -t rsa' or copy existing key.")
+ops_dir = None
+wheelhouse_dir = None
 
 # abort on prompts (password, hosts, etc.)
 env.abort_on_prompts = True
@@ -90,17 +35,147 @@ env.abort_on_prompts = True
 # do all tasks in parallel
 env.parallel = True
 
-# define ops home directory
-ops_dir = context['OPS_HOME']
+
+def setup_env():
+    """Load SDS config and define fabric roles and key file; a no-op once loaded."""
+
+    global ops_dir, wheelhouse_dir
+    if len(context) > 0: return
+
+    # define private EC2 IP addresses for infrastructure hosts
+    sds_cfg = get_user_config_path()
+    if not os.path.isfile(sds_cfg):
+        raise RuntimeError("SDS configuration file doesn't exist. Run 'sds configure'.")
+    cfg = load_yaml(sds_cfg)
+
+    # define and build groups to reduce redundancy in defining roles
+
+    # mozart hosts
+    mozart_host = '%s' % cfg['MOZART_PVT_IP']
+    mozart_rabbit_host = '%s' % cfg['MOZART_RABBIT_PVT_IP']
+    mozart_redis_host = '%s' % cfg['MOZART_REDIS_PVT_IP']
+    mozart_es_host = '%s' % cfg['MOZART_ES_PVT_IP']
+
+    # metrics host
+    metrics_host = '%s' % cfg['METRICS_PVT_IP']
+    metrics_redis_host = '%s' % cfg['METRICS_REDIS_PVT_IP']
+    metrics_es_host = '%s' % cfg['METRICS_ES_PVT_IP']
+
+    # grq host
+    grq_host = '%s' % cfg['GRQ_PVT_IP']
+    grq_es_host = '%s' % cfg['GRQ_ES_PVT_IP']
+
+    # factotum host
+    factotum_host = '%s' % cfg['FACTOTUM_PVT_IP']
+
+    # continuous integration host
+    ci_host = '%s' % cfg['CI_PVT_IP']
+
+    # all verdi hosts
+    verdi_hosts = [
+        '%s' % cfg['VERDI_PVT_IP'],
+    ]
+    if cfg.get('OTHER_VERDI_HOSTS', None) is not None:
+        verdi_hosts.extend([i['VERDI_PVT_IP'] for i in cfg['OTHER_VERDI_HOSTS'] if i['VERDI_PVT_IP'] is not None])
+
+    # define roles
+    env.roledefs = {
+        'mozart': [ mozart_host ],
+        'mozart-rabbit': [ mozart_rabbit_host ],
+        'mozart-redis': [ mozart_redis_host ],
+        'mozart-es': [ mozart_es_host ],
+        'metrics': [ metrics_host ],
+        'metrics-redis': [ metrics_redis_host ],
+        'metrics-es': [ metrics_es_host ],
+        'grq': [ grq_host ],
+        'grq-es': [ grq_es_host ],
+        'factotum': [ factotum_host ],
+        'ci': [ ci_host ],
+        'verdi': verdi_hosts,
+    }
+
+    # define key file
+    env.key_filename = cfg['KEY_FILENAME']
+    if not os.path.isfile(env.key_filename):
+        raise RuntimeError("SSH key filename %s doesn't exist. " % env.key_filename +
+                           "Run 'ssh-keygen -t rsa' or copy existing key.")
+
+    # define ops home directory and local wheelhouse of HySDS package dependencies
+    ops_dir = cfg['OPS_HOME']
+    wheelhouse_dir = os.path.join(ops_dir, 'mozart/wheelhouse')
+    context.update(cfg)
+
+
+def execute(task, *args, **kwargs):
+    """Execute fabric task, setting up roles, env and template contexts on first use."""
+
+    setup_env()
+    build_contexts(kwargs.get('roles', []))
+    return fabric_execute(task, *args, **kwargs)
+
 
 ##########################
 # general functions
 ##########################
 
-def get_context(node_type=None):
-    """Modify context based on host string."""
+class FrozenContext(dict):
+    """Read-only template context shared across tasks; copy with dict() to modify."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Template context is read-only; use dict(ctx) for a modifiable copy.")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (FrozenContext, (dict(self),))
+
+
+class FrozenList(list):
+    """Read-only list in a template context; renders the same as a list."""
 
-    ctx = deepcopy(context)
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Template context is read-only; use list(value) for a modifiable copy.")
+
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = reverse = sort = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+def freeze(obj):
+    """Recursively convert dicts and lists in config values to read-only equivalents."""
+
+    if isinstance(obj, dict):
+        return FrozenContext((k, freeze(v)) for k, v in obj.items())
+    if isinstance(obj, list):
+        return FrozenList(freeze(i) for i in obj)
+    return obj
+
+
+# memoized template contexts keyed by node type and (node type, host string)
+_node_contexts = {}
+_host_contexts = {}
+
+
+def get_node_context(node_type=None):
+    """Return context for node type, built once from the SDS config."""
+
+    if node_type in _node_contexts: return _node_contexts[node_type]
+    setup_env()
+    ctx = dict(context)
 
     if node_type == 'mozart':
         if ctx['MOZART_PVT_IP'] == ctx['MOZART_RABBIT_PVT_IP']:
@@ -126,13 +201,35 @@ def get_context(node_type=None):
     if ctx['METRICS_REDIS_PASSWORD'] is None:
         ctx['METRICS_REDIS_PASSWORD'] = ''
 
-    # set hostname
-    ctx['HOST_STRING'] = env.host_string
-
     # split LDAP groups
     ctx['LDAP_GROUPS'] = [i.strip() for i in ctx['LDAP_GROUPS'].split(',')]
 
-    return ctx
+    _node_contexts[node_type] = freeze(ctx)
+    return _node_contexts[node_type]
+
+
+def get_context(node_type=None):
+    """Return read-only context for node type and current host string."""
+
+    key = (node_type, env.host_string)
+    if key not in _host_contexts:
+        ctx = dict(get_node_context(node_type))
+        ctx['HOST_STRING'] = env.host_string
+        _host_contexts[key] = FrozenContext(ctx)
+    return _host_contexts[key]
+
+
+def build_contexts(roles):
+    """Build node contexts of the roles a task runs on before parallel tasks fork,
+       so each child inherits them instead of rebuilding them; the cheap per-host
+       copy is made lazily by get_context in the child."""
+
+    for node_type in [None] + list(roles):
+        get_node_context(node_type)
+
+
+# the fab command line (e.g. with ~/.sds/files/cluster.py) runs tasks directly
+if os.path.basename(sys.argv[0]) == 'fab': setup_env()
 
 
 def resolve_files_dir(fname, files_dir):
@@ -219,72 +316,186 @@ def sudo_rm_rf(path):
     run('sudo rm -rf %s' % path)
 
 
+def run_batch(cmds):
+    """Run shell commands in order in a single remote invocation, stopping at first failure."""
+
+    if len(cmds) == 0: return
+    run('set -e\n%s' % '\n'.join(cmds))
+
+
+# jinja environments keyed by template dir, so each template compiles once per run
+_jinja_envs = {}
+
+
+def get_template(tmpl, tmpl_dir):
+    """Return compiled jinja template from template dir."""
+
+    from jinja2 import Environment, FileSystemLoader
+    tmpl_dir = os.path.expanduser(tmpl_dir)
+    if tmpl_dir not in _jinja_envs:
+        _jinja_envs[tmpl_dir] = Environment(loader=FileSystemLoader(tmpl_dir))
+    return _jinja_envs[tmpl_dir].get_template(tmpl)
+
+
+def compile_templates(templates):
+    """Compile (tmpl, dest, tmpl_dir, node_type) templates locally ahead of parallel tasks."""
+
+    for tmpl, dest, tmpl_dir, node_type in templates: get_template(tmpl, tmpl_dir)
+
+
+def render_template(tmpl, tmpl_dir, ctx):
+    """Render template with context as utf-8 bytes, like upload_template does."""
+
+    return get_template(tmpl, tmpl_dir).render(**ctx or {}).encode('utf-8')
+
+
+def get_remote_checksums(dests):
+    """Return sha1 checksums of remote files in one round trip; None if missing."""
+
+    cmds = ['echo SDS_SUM %d $(sha1sum 2>/dev/null < %s | cut -c1-40)' % (i, dest)
+            for i, dest in enumerate(dests)]
+    with settings(hide('everything'), warn_only=True):
+        out = run('\n'.join(cmds))
+    sums = [l.rstrip('\r').split(' ')[1:3] for l in out.splitlines() if l.startswith('SDS_SUM ')]
+    if len(sums) != len(dests) or any(len(i) != 2 for i in sums):
+        return [None for dest in dests]
+    return [i[1] or None for i in sums]
+
+
+def upload_templates(templates):
+    """Render (tmpl, dest, tmpl_dir, ctx) templates and upload only those differing
+       from the remote file, in a single transfer; return number of files uploaded."""
+
+    rendered = [(dest, render_template(tmpl, tmpl_dir, ctx)) for tmpl, dest, tmpl_dir, ctx in templates]
+    sums = get_remote_checksums([dest for dest, text in rendered])
+    changed = [(dest, text) for (dest, text), remote_sum in zip(rendered, sums)
+               if hashlib.sha1(text).hexdigest() != remote_sum]
+    logger.debug("{} of {} templates changed on {}.".format(len(changed), len(rendered), env.host_string))
+    if len(changed) == 0: return 0
+    if len(changed) == 1:
+        put(io.BytesIO(changed[0][1]), changed[0][0])
+        return 1
+
+    # ship changed files as one tarball and copy each into place
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w:gz') as tar:
+        for i, (dest, text) in enumerate(changed):
+            info = tarfile.TarInfo(str(i))
+            info.size = len(text)
+            info.mtime = time.time()
+            tar.addfile(info, io.BytesIO(text))
+    buf.seek(0)
+    tar_file = '/tmp/sds-templates-%s.tgz' % uuid.uuid4().hex
+    put(buf, tar_file)
+    cmds = ['tmp_dir=$(mktemp -d)', "trap 'rm -rf $tmp_dir %s' EXIT" % tar_file,
+            'tar xzf %s -C $tmp_dir' % tar_file]
+    cmds.extend(['cp $tmp_dir/%d %s' % (i, dest) for i, (dest, text) in enumerate(changed)])
+    run_batch(cmds)
+    return len(changed)
+
+
+def send_templates(templates):
+    """Send (tmpl, dest, tmpl_dir, node_type) templates rendered with the host's context."""
+
+    return upload_templates([(tmpl, dest, tmpl_dir, get_context(node_type))
+                             for tmpl, dest, tmpl_dir, node_type in templates])
+
+
 def send_template(tmpl, dest, tmpl_dir=None, node_type=None):
     if tmpl_dir is None: tmpl_dir = get_user_files_path()
-    else: tmpl_dir = os.path.expanduser(tmpl_dir)
-    upload_template(tmpl, dest, use_jinja=True, context=get_context(node_type),
-                    template_dir=tmpl_dir)
+    send_templates([(tmpl, dest, tmpl_dir, node_type)])
 
 
 def send_template_user_override(tmpl, dest, tmpl_dir=None, node_type=None):
     if tmpl_dir is None: tmpl_dir = get_user_files_path()
     else: tmpl_dir = os.path.expanduser(tmpl_dir)
-    upload_template(tmpl, dest, use_jinja=True, context=get_context(node_type),
-                    template_dir=resolve_files_dir(tmpl, tmpl_dir))
+    send_templates([(tmpl, dest, resolve_files_dir(tmpl, tmpl_dir), node_type)])
 
 
 def set_spyddder_settings():
-    upload_template('settings.json.tmpl', '~/verdi/ops/spyddder-man/settings.json', use_jinja=True,
-                    context=get_context(), template_dir=os.path.join(ops_dir, 'mozart/ops/spyddder-man'))
-
-
-def rsync_code(node_type, dir_path=None):
+    upload_templates([('settings.json.tmpl', '~/verdi/ops/spyddder-man/settings.json',
+                       os.path.join(ops_dir, 'mozart/ops/spyddder-man'), get_context())])
+
+
+def get_code_repos(node_type):
+    """Return ops repos shipped to a node type."""
+
+    repos = ['osaka', 'hysds_commons', 'hysds', 'prov_es', 'sciflo',
+             'container-builder', 'lightweight-jobs', 'hysds-dockerfiles']
+    if node_type == 'mozart': repos.extend(['mozart', 'figaro'])
+    if node_type in ('verdi', 'factotum'): repos.append('spyddder-man')
+    if node_type == 'grq': repos.extend(['grq2', 'tosca'])
+    return repos
+
+
+def get_repo_rev(repo_dir):
+    """Return key of a local repo's working tree: a hash of the blob ids of its
+       tracked files, including uncommitted changes, and of its untracked files
+       that aren't ignored. Nothing is written to the repo's object store. Return
+       None if it can't be determined."""
+
+    if not os.path.exists(os.path.join(repo_dir, '.git')): return None
+    try:
+        # blob ids of the index
+        entries = {}
+        out = subprocess.check_output(['git', 'ls-files', '-s', '-z'], cwd=repo_dir)
+        for entry in out.split(b'\0'):
+            if not entry: continue
+            info, path = entry.split(b'\t', 1)
+            mode, sha, stage = info.split()
+            entries[path] = sha
+
+        # hash modified and untracked files without writing them to the object store
+        out = subprocess.check_output(['git', 'ls-files', '-z', '-m', '-o', '--exclude-standard'],
+                                      cwd=repo_dir)
+        changed = sorted(set(i for i in out.split(b'\0') if i))
+        for path in [i for i in changed if not os.path.lexists(os.path.join(repo_dir, i))]:
+            entries.pop(path, None)
+        changed = [i for i in changed if os.path.lexists(os.path.join(repo_dir, i))]
+        if len(changed) > 0:
+            p = subprocess.Popen(['git', 'hash-object', '--stdin-paths'], cwd=repo_dir,
+                                 stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            out = p.communicate(b'\n'.join(changed) + b'\n')[0]
+            if p.returncode != 0:
+                raise subprocess.CalledProcessError(p.returncode, 'git hash-object')
+            entries.update(zip(changed, out.split()))
+    except (OSError, ValueError, subprocess.CalledProcessError), e:
+        logger.debug("Failed to get tree hash of {}: {}".format(repo_dir, e))
+        return None
+    h = hashlib.sha1()
+    for path in sorted(entries):
+        h.update(b'%s\0%s\n' % (path, entries[path]))
+    return h.hexdigest()
+
+
+def rsync_repo(repo, dir_path):
+    """Incrementally sync repo to ops dir, skipping it if its working tree key
+       matches the one last shipped to this host."""
+
+    repo_dir = os.path.join(ops_dir, 'mozart/ops', repo)
+    rev_file = '%s/ops/.sds_revs/%s' % (dir_path, repo)
+    rev = get_repo_rev(repo_dir)
+    if rev is not None:
+        with settings(hide('everything'), warn_only=True):
+            shipped = run('test -d %s/ops/%s && cat %s' % (dir_path, repo, rev_file))
+        if shipped.succeeded and shipped.strip() == rev:
+            logger.debug("Skipping %s on %s: unchanged at %s." % (repo, env.host_string, rev))
+            return False
+    rsync_project('%s/ops/' % dir_path, repo_dir, delete=True,
+                  extra_opts='%s --checksum' % extra_opts, ssh_opts=ssh_opts)
+    if rev is None: run('rm -f %s' % rev_file)
+    else: run('mkdir -p %s/ops/.sds_revs && echo %s > %s' % (dir_path, rev, rev_file))
+    return True
+
+
+def rsync_code(node_type, dir_path=None, incremental=False):
     if dir_path is None: dir_path = node_type
-    rm_rf('%s/ops/osaka' % dir_path)
-    rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/osaka'),
-                  extra_opts=extra_opts, ssh_opts=ssh_opts)
-    rm_rf('%s/ops/hysds_commons' % dir_path)
-    rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/hysds_commons'),
-                  extra_opts=extra_opts, ssh_opts=ssh_opts)
-    rm_rf('%s/ops/hysds' % dir_path)
-    rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/hysds'),
-                  extra_opts=extra_opts, ssh_opts=ssh_opts)
-    rm_rf('%s/ops/prov_es' % dir_path)
-    rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/prov_es'),
-                  extra_opts=extra_opts, ssh_opts=ssh_opts)
-    rm_rf('%s/ops/sciflo' % dir_path)
-    rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/sciflo'),
-                  extra_opts=extra_opts, ssh_opts=ssh_opts)
-    rm_rf('%s/ops/container-builder' % dir_path)
-    rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/container-builder'),
-                  extra_opts=extra_opts, ssh_opts=ssh_opts)
-    rm_rf('%s/ops/lightweight-jobs' % dir_path)
-    rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/lightweight-jobs'),
-                  extra_opts=extra_opts, ssh_opts=ssh_opts)
-    rm_rf('%s/ops/hysds-dockerfiles' % dir_path)
-    rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/hysds-dockerfiles'),
-                  extra_opts=extra_opts, ssh_opts=ssh_opts)
-    if node_type in ('mozart'):
-        rm_rf('%s/ops/mozart' % dir_path)
-        rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/mozart'),
-                      extra_opts=extra_opts, ssh_opts=ssh_opts)
-        rm_rf('%s/ops/figaro' % dir_path)
-        rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/figaro'),
-                      extra_opts=extra_opts, ssh_opts=ssh_opts)
-    if node_type == 'verdi':
-        rm_rf('%s/ops/spyddder-man' % dir_path)
-        rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/spyddder-man'),
-                      extra_opts=extra_opts, ssh_opts=ssh_opts)
-    if node_type == 'factotum':
-        rm_rf('%s/ops/spyddder-man' % dir_path)
-        rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/spyddder-man'),
-                      extra_opts=extra_opts, ssh_opts=ssh_opts)
-    if node_type == 'grq':
-        rm_rf('%s/ops/grq2' % dir_path)
-        rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/grq2'),
-                      extra_opts=extra_opts, ssh_opts=ssh_opts)
-        rm_rf('%s/ops/tosca' % dir_path)
-        rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops/tosca'),
+    for repo in get_code_repos(node_type):
+        if incremental:
+            rsync_repo(repo, dir_path)
+            continue
+        rm_rf('%s/ops/%s %s/ops/.sds_revs/%s' % (dir_path, repo, dir_path, repo))
+        rsync_project('%s/ops/' % dir_path, os.path.join(ops_dir, 'mozart/ops', repo),
                       extra_opts=extra_opts, ssh_opts=ssh_opts)
 
 
@@ -374,6 +585,17 @@ def status():
         print(blink(highlight("Supervisord is not running on %s." % role, 'red')))
 
 
+def supervisor_status():
+    """Return supervisorctl status output or None if supervisord isn't running."""
+
+    role, hysds_dir, hostname = resolve_role()
+    with hide('everything'):
+        if not exists('%s/run/supervisor.sock' % hysds_dir): return None
+        with prefix('source %s/bin/activate' % hysds_dir):
+            with settings(warn_only=True):
+                return run('supervisorctl status')
+
+
 def ensure_venv(hysds_dir):
     act_file = "~/%s/bin/activate" % hysds_dir
     if not exists(act_file):
@@ -580,20 +802,69 @@ def pip_uninstall(pkg, node_type='verdi'):
         run('pip uninstall -y %s' % pkg)
 
 
-def pip_install_with_req(node_type, dest):
+# remote command printing current and last installed fingerprints of a package dir
+pip_fp_cmd = ('echo SDS_PIP "$(cd {dest} && (cat setup.py setup.cfg requirements*.txt 2>/dev/null; '
+              'python setup.py --version 2>/dev/null; echo ndeps={ndeps}) | sha1sum | cut -d" " -f1)" '
+              '"$(cat {fp_file} 2>/dev/null)"')
+
+
+def get_pip_fp_file(node_type, dest):
+    return '~/%s/.sds_pip/%s' % (node_type, os.path.basename(dest.rstrip('/')))
+
+
+def get_pip_fingerprints(node_type, dests, ndeps=False):
+    """Return list of (current, installed) fingerprints of setup.py, requirements
+       and version for each package dir; either is None if unknown."""
+
+    cmds = [pip_fp_cmd.format(dest=dest, ndeps=ndeps, fp_file=get_pip_fp_file(node_type, dest))
+            for dest in dests]
     with prefix('source ~/%s/bin/activate' % node_type):
-        with cd(dest):
-            run('pip install --process-dependency-links -e .')
+        with settings(hide('everything'), warn_only=True):
+            out = run('\n'.join(cmds))
+    fps = [l.rstrip('\r').split(' ')[1:3] for l in out.splitlines() if l.startswith('SDS_PIP ')]
+    if len(fps) != len(dests) or any(len(i) != 2 for i in fps):
+        return [(None, None) for dest in dests]
+    return [(i[0] or None, i[1] or None) for i in fps]
+
+
+def rsync_wheelhouse(node_type):
+    """Sync local wheelhouse to the venv dir of node type."""
+
+    rsync_project('%s/' % node_type, wheelhouse_dir, delete=True,
+                  extra_opts=extra_opts, ssh_opts=ssh_opts)
+
 
-def pip_install_with_req(node_type, dest, ndeps):
+def pip_install_pkgs(node_type, dests, ndeps=False, wheelhouse=False):
+    """Install package dirs whose fingerprint changed in a single pip invocation,
+       resolving dependencies only from the shipped wheelhouse if wheelhouse is set."""
+
+    fps = get_pip_fingerprints(node_type, dests, ndeps)
+    changed = [(dest, fp) for dest, (fp, installed) in zip(dests, fps)
+               if fp is None or fp != installed]
+    if len(changed) == 0:
+        logger.debug("Skipping pip install on %s: packages unchanged." % env.host_string)
+        return
     with prefix('source ~/%s/bin/activate' % node_type):
-        with cd(dest):
-	    if ndeps:
-		logger.debug("ndeps is set, so running pip without process-dependency-links")
-		run('pip install --no-deps -e .')
-	    else:
-		logger.debug("ndeps is NOT set, so running pip with process-dependency-links")
-            	run('pip install --process-dependency-links -e .')
+        if ndeps:
+            logger.debug("ndeps is set, so running pip without process-dependency-links")
+            opts = '--no-deps'
+        elif wheelhouse:
+            logger.debug("wheelhouse is set, so running pip against ~/%s/wheelhouse only" % node_type)
+            opts = '--no-index --find-links ~/%s/wheelhouse' % node_type
+        else:
+            logger.debug("ndeps is NOT set, so running pip with process-dependency-links")
+            opts = '--process-dependency-links'
+        run('pip install %s %s' % (opts, ' '.join('-e %s' % dest for dest, fp in changed)))
+    cmds = ['mkdir -p ~/%s/.sds_pip' % node_type]
+    for dest, fp in changed:
+        fp_file = get_pip_fp_file(node_type, dest)
+        cmds.append('rm -f %s' % fp_file if fp is None else 'echo %s > %s' % (fp, fp_file))
+    run(' && '.join(cmds))
+
+
+def pip_install_with_req(node_type, dest, ndeps=False):
+    pip_install_pkgs(node_type, [dest], ndeps)
+
 
 def python_setup_develop(node_type, dest):
     with prefix('source ~/%s/bin/activate' % node_type):
@@ -617,7 +888,7 @@ def add_ci_job(repo, proto, branch=None, release=False):
         else:
             job_name = "container-builder_%s_%s_%s" % (owner, name, branch)
             config_tmpl = 'config-branch.xml'
-        ctx = get_context()
+        ctx = dict(get_context())
         ctx['PROJECT_URL'] = repo
         ctx['BRANCH'] = branch
         job_dir = '%s/jobs/%s' % (ctx['JENKINS_DIR'], job_name)
@@ -664,32 +935,16 @@ def send_shipper_conf(node_type, log_dir, cluster_jobs, redis_ip_job_status,
                       cluster_metrics, redis_ip_metrics):
     role, hysds_dir, hostname = resolve_role()
 
-    ctx = get_context(node_type)
-    if node_type == 'mozart':
-        ctx.update({'cluster_jobs': cluster_jobs, 'cluster_metrics': cluster_metrics })
-        upload_template('indexer.conf.mozart', '~/mozart/etc/indexer.conf', use_jinja=True, context=ctx,
-                        template_dir=os.path.join(ops_dir, 'mozart/ops/hysds/configs/logstash'))
-        upload_template('job_status.template', '~/mozart/etc/job_status.template', use_jinja=True,
-                        template_dir=os.path.join(ops_dir, 'mozart/ops/hysds/configs/logstash'))
-        upload_template('worker_status.template', '~/mozart/etc/worker_status.template', use_jinja=True,
-                        template_dir=os.path.join(ops_dir, 'mozart/ops/hysds/configs/logstash'))
-        upload_template('task_status.template', '~/mozart/etc/task_status.template', use_jinja=True,
-                        template_dir=os.path.join(ops_dir, 'mozart/ops/hysds/configs/logstash'))
-        upload_template('event_status.template', '~/mozart/etc/event_status.template', use_jinja=True,
-                        template_dir=os.path.join(ops_dir, 'mozart/ops/hysds/configs/logstash'))
-    elif node_type == 'metrics':
-        ctx.update({'cluster_jobs': cluster_jobs, 'cluster_metrics': cluster_metrics })
-        upload_template('indexer.conf.metrics', '~/metrics/etc/indexer.conf', use_jinja=True, context=ctx,
-                        template_dir=os.path.join(ops_dir, 'mozart/ops/hysds/configs/logstash'))
-        upload_template('job_status.template', '~/metrics/etc/job_status.template', use_jinja=True,
-                        template_dir=os.path.join(ops_dir, 'mozart/ops/hysds/configs/logstash'))
-        upload_template('worker_status.template', '~/metrics/etc/worker_status.template', use_jinja=True,
-                        template_dir=os.path.join(ops_dir, 'mozart/ops/hysds/configs/logstash'))
-        upload_template('task_status.template', '~/metrics/etc/task_status.template', use_jinja=True,
-                        template_dir=os.path.join(ops_dir, 'mozart/ops/hysds/configs/logstash'))
-        upload_template('event_status.template', '~/metrics/etc/event_status.template', use_jinja=True,
-                        template_dir=os.path.join(ops_dir, 'mozart/ops/hysds/configs/logstash'))
-    else: raise RuntimeError("Unknown node type: %s" % node_type) 
+    if node_type not in ('mozart', 'metrics'):
+        raise RuntimeError("Unknown node type: %s" % node_type)
+    ctx = dict(get_context(node_type))
+    ctx.update({'cluster_jobs': cluster_jobs, 'cluster_metrics': cluster_metrics })
+    template_dir = os.path.join(ops_dir, 'mozart/ops/hysds/configs/logstash')
+    templates = [('indexer.conf.%s' % node_type, '~/%s/etc/indexer.conf' % node_type, template_dir, ctx)]
+    for status in ('job', 'worker', 'task', 'event'):
+        templates.append(('%s_status.template' % status, '~/%s/etc/%s_status.template' % (node_type, status),
+                          template_dir, None))
+    upload_templates(templates)
 
 
 def send_celeryconf(node_type):
@@ -701,14 +956,13 @@ def send_celeryconf(node_type):
     else: raise RuntimeError("Unknown node type: %s" % node_type)
     ctx = get_context(node_type)
     dest_file = '~/%s/ops/hysds/celeryconfig.py' % base_dir
-    upload_template('celeryconfig.py.tmpl', dest_file, use_jinja=True, context=ctx,
-                    template_dir=template_dir)
+    upload_templates([('celeryconfig.py.tmpl', dest_file, template_dir, ctx)])
 
 
 def send_mozartconf():
     dest_file = '~/mozart/ops/mozart/settings.cfg'
-    upload_template('settings.cfg.tmpl', dest_file, use_jinja=True, context=get_context('mozart'),
-                    template_dir=os.path.join(ops_dir, 'mozart/ops/mozart/settings'))
+    upload_templates([('settings.cfg.tmpl', dest_file, os.path.join(ops_dir, 'mozart/ops/mozart/settings'),
+                       get_context('mozart'))])
     with prefix('source ~/mozart/bin/activate'):
         with cd('~/mozart/ops/mozart'):
             mkdir('~/mozart/ops/mozart/data', context['OPS_USER'], context['OPS_USER'])
@@ -719,8 +973,7 @@ def send_figaroconf():
     dest_file = '~/mozart/ops/figaro/settings.cfg'
     #upload_template('settings.cfg.tmpl', dest_file, use_jinja=True, context=get_context('mozart'),
     #                template_dir=os.path.join(ops_dir, 'mozart/ops/figaro/settings'))
-    upload_template('figaro_settings.cfg.tmpl', dest_file, use_jinja=True, context=get_context('mozart'),
-                    template_dir=get_user_files_path())
+    upload_templates([('figaro_settings.cfg.tmpl', dest_file, get_user_files_path(), get_context('mozart'))])
     with prefix('source ~/mozart/bin/activate'):
         with cd('~/mozart/ops/figaro'):
             mkdir('~/mozart/ops/figaro/data', context['OPS_USER'], context['OPS_USER'])
@@ -729,15 +982,14 @@ def send_figaroconf():
 
 def send_grq2conf():
     dest_file = '~/sciflo/ops/grq2/settings.cfg'
-    upload_template('settings.cfg.tmpl', dest_file, use_jinja=True, context=get_context('grq'),
-                    template_dir=os.path.join(ops_dir, 'mozart/ops/grq2/config'))
+    upload_templates([('settings.cfg.tmpl', dest_file, os.path.join(ops_dir, 'mozart/ops/grq2/config'),
+                       get_context('grq'))])
 
 
 def send_toscaconf(send_file='settings.cfg.tmpl', template_dir=get_user_files_path()):
     tmpl_dir = os.path.expanduser(template_dir)
     dest_file = '~/sciflo/ops/tosca/settings.cfg'
-    upload_template(send_file, dest_file, use_jinja=True, context=get_context('grq'),
-                    template_dir=tmpl_dir)
+    upload_templates([(send_file, dest_file, tmpl_dir, get_context('grq'))])
     with prefix('source ~/sciflo/bin/activate'):
         with cd('~/sciflo/ops/tosca'):
             run('./db_create.py')
@@ -783,14 +1035,76 @@ def ensure_ssl(node_type):
 # ship code
 ##########################
 
-def ship_code(cwd, tar_file, encrypt=False):
-    ctx = get_context()
-    with cd(cwd):
-        run('tar --exclude-vcs -cvjf %s *' % tar_file)
+# compression codecs of ship bundles: (compress command, bundle extension);
+# pbzip2, pigz and zstd use all cores
+BUNDLE_CODECS = {
+    'bzip2': ('bzip2', '.tbz2'),
+    'pbzip2': ('pbzip2', '.tbz2'),
+    'pigz': ('pigz', '.tgz'),
+    'zstd': ('zstd -q -T0', '.tar.zst'),
+}
+
+# fingerprint of a tree's paths, modes, link targets and file contents, skipping vcs dirs
+tree_hash_cmd = ("cd {cwd} && {{ find . {prune} -printf '%m %p %l\\n' | LC_ALL=C sort; "
+                 "find . {prune} -type f -print0 | LC_ALL=C sort -z | xargs -0 -r sha1sum; }} "
+                 "| sha1sum | cut -c1-40")
+vcs_prune = "\\( -name .git -o -name .svn -o -name .hg -o -name CVS \\) -prune -o"
+
+
+def get_bundle_ext(codec='bzip2'):
+    """Return file extension of bundle compressed with codec."""
+
+    return BUNDLE_CODECS[codec][1]
+
+
+def get_tree_hash(cwd):
+    """Return content fingerprint of remote tree."""
+
+    with hide('everything'):
+        return run(tree_hash_cmd.format(cwd=cwd, prune=vcs_prune)).strip()
+
+
+def get_bundle_hash(bundle):
+    """Return fingerprint recorded when bundle was created; None if bundle is missing."""
+
+    with settings(hide('everything'), warn_only=True):
+        ret = run('test -e %s && cat %s.tree' % (bundle, bundle))
+    return (ret.strip() or None) if ret.succeeded else None
+
+
+def ship_code(cwd, tar_file, encrypt=False, codec='bzip2', level=None):
+    compress = BUNDLE_CODECS[codec][0]
+    if level is not None: compress = '%s -%d' % (compress, level)
+
+    # only recompress if tree or compression changed since tar file was created
+    tree_hash = '%s %s' % (get_tree_hash(cwd), compress)
+    if get_bundle_hash(tar_file) != tree_hash:
+        with cd(cwd):
+            run_batch([
+                'set -o pipefail',
+                'tar --exclude-vcs -cf - * | %s > %s.tmp' % (compress, tar_file),
+                'mv %s.tmp %s' % (tar_file, tar_file),
+                "echo '%s' > %s.tree" % (tree_hash, tar_file),
+            ])
+    else: logger.debug("{} is up to date with {}.".format(tar_file, cwd))
     if encrypt is False:
-        run('gsutil cp %s gs://%s/' % (tar_file, ctx['CODE_BUCKET']))
+        run('gsutil cp %s %s' % (tar_file, get_bundle_url(tar_file)))
     else:
-        run('gsutil cp %s gs://%s/' % (tar_file, ctx['CODE_BUCKET']))
+        run('gsutil cp %s %s' % (tar_file, get_bundle_url(tar_file)))
+
+
+def get_bundle_url(tar_file):
+    """Return code bucket URL of shipped bundle."""
+
+    setup_env()
+    return 'gs://%s/%s' % (context['CODE_BUCKET'], os.path.basename(tar_file))
+
+
+def get_sha1(path):
+    """Return sha1 checksum of remote file."""
+
+    with hide('everything'):
+        return run('sha1sum %s' % path).split()[0]
 
 
 ##########################
@@ -799,38 +1113,66 @@ def ship_code(cwd, tar_file, encrypt=False):
 
 def send_awscreds():
     ctx = get_context()
-    if exists('.aws'): run('rm -rf .aws')
-    mkdir('.aws', context['OPS_USER'], context['OPS_USER'])
-    run('chmod 700 .aws')
-    upload_template('aws_config', '.aws/config', use_jinja=True, context=ctx,
-                    template_dir=get_user_files_path())
+    tmpl_dir = get_user_files_path()
+    templates = [('aws_config', '.aws/config', tmpl_dir, ctx),
+                 ('boto', '.boto', tmpl_dir, ctx),
+                 ('s3cfg', '.s3cfg', tmpl_dir, ctx)]
+    cmds = ['mkdir -p .aws', 'chmod 700 .aws']
     if ctx.get('AWS_ACCESS_KEY', None) not in (None, ""):
-        upload_template('aws_credentials', '.aws/credentials', use_jinja=True, context=ctx,
-                        template_dir=get_user_files_path())
-    run('chmod 600 .aws/*')
-    if exists('.boto'): run('rm -rf .boto')
-    upload_template('boto', '.boto', use_jinja=True, context=ctx,
-                    template_dir=get_user_files_path())
-    run('chmod 600 .boto')
-    if exists('.s3cfg'): run('rm -rf .s3cfg')
-    upload_template('s3cfg', '.s3cfg', use_jinja=True, context=ctx,
-                    template_dir=get_user_files_path())
-    run('chmod 600 .s3cfg')
+        templates.append(('aws_credentials', '.aws/credentials', tmpl_dir, ctx))
+    else: cmds.append('rm -f .aws/credentials')
+    run_batch(cmds)
+    upload_templates(templates)
+    run('chmod 600 .aws/* .boto .s3cfg')
 
 
 ##########################
 # ship verdi code bundle
 ##########################
 
-def send_queue_config(queue):
-    ctx = get_context()
-    ctx.update({'queue': queue})
-    upload_template('install.sh', '~/verdi/ops/install.sh', use_jinja=True, context=ctx,
-                    template_dir=get_user_files_path())
-    upload_template('datasets.json.tmpl.asg', '~/verdi/etc/datasets.json',
-                    use_jinja=True, context=ctx, template_dir=get_user_files_path())
-    upload_template('supervisord.conf.tmpl', '~/verdi/etc/supervisord.conf.tmpl',
-                    use_jinja=True, context=ctx, template_dir=get_user_files_path())
+# per-queue staging trees of verdi bundles, so queues can be bundled concurrently
+ship_dir = '~/verdi/ship'
+
+
+def get_queue_stage_dir(queue):
+    """Return staging dir of queue's verdi bundle."""
+
+    return '%s/%s' % (ship_dir, queue)
+
+
+def stage_queue_bundle(queue, link_ops=True):
+    """Build queue's staging tree of etc and creds, hard linking the shared ops dir
+       into it unless the code ships separately in the base bundle."""
+
+    stage_dir = get_queue_stage_dir(queue)
+    cmds = ['rm -rf %s' % stage_dir, 'mkdir -p %s' % ship_dir]
+    if link_ops:
+        cmds.extend([
+            'cp -al ~/verdi/ops %s' % stage_dir,
+
+            # queue-specific files must be new files, never written through the hard links
+            'rm -rf %s/install.sh %s/etc %s/creds' % (stage_dir, stage_dir, stage_dir),
+        ])
+    else: cmds.append('mkdir -p %s' % stage_dir)
+    cmds.extend([
+        'cp -rp ~/verdi/etc %s/etc' % stage_dir,
+        'rm -f %s/etc/supervisord.conf' % stage_dir,
+        'mkdir -p %s/creds' % stage_dir,
+    ])
+    for cred in ('~/.netrc', '~/.boto', '~/.s3cfg', '~/.aws'):
+        cmds.append('if [ -e %s ]; then cp -rp %s %s/creds/; fi' % (cred, cred, stage_dir))
+    run_batch(cmds)
+
+
+def send_queue_config(queue, stage_dir, base_bundle_url='', base_bundle_sha1=''):
+    ctx = dict(get_context())
+    ctx.update({'queue': queue, 'BASE_BUNDLE_URL': base_bundle_url,
+                'BASE_BUNDLE_SHA1': base_bundle_sha1})
+    tmpl_dir = get_user_files_path()
+    upload_templates([('install.sh', '%s/install.sh' % stage_dir, tmpl_dir, ctx),
+                      ('datasets.json.tmpl.asg', '%s/etc/datasets.json' % stage_dir, tmpl_dir, ctx),
+                      ('supervisord.conf.tmpl', '%s/etc/supervisord.conf.tmpl' % stage_dir, tmpl_dir, ctx)])
+    run_batch(['chmod 755 %s/install.sh' % stage_dir, 'chmod 644 %s/etc/datasets.json' % stage_dir])
 
 
 ##########################
@@ -860,7 +1202,12 @@ def ship_style(bucket=None, encrypt=False):
 # create cloud function zip
 ##########################
 
-def create_zip(zip_dir, zip_file):
+def create_zip(zip_dir, zip_file, level=9):
+    tree_hash = '%s zip -%d' % (get_tree_hash(zip_dir), level)
+    if get_bundle_hash(zip_file) == tree_hash:
+        logger.debug("{} is up to date with {}.".format(zip_file, zip_dir))
+        return
     if exists(zip_file): run('rm -rf %s' % zip_file)
     with cd(zip_dir):
-        run('zip -r -9 {} *'.format(zip_file))
+        run('zip -r -{} {} *'.format(level, zip_file))
+    run("echo '%s' > %s.tree" % (tree_hash, zip_file))
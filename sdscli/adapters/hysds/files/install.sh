@@ -4,6 +4,33 @@ BASE_PATH=$(cd "${BASE_PATH}"; pwd)
 
 source $HOME/verdi/bin/activate
 
+# extract shared base bundle of code next to this queue bundle; it is
+# downloaded only once per instance and reused while its checksum matches
+BASE_BUNDLE_URL="{{ BASE_BUNDLE_URL }}"
+BASE_BUNDLE_SHA1="{{ BASE_BUNDLE_SHA1 }}"
+if [ -n "$BASE_BUNDLE_URL" ]; then
+  BASE_BUNDLE=$HOME/verdi/cache/base-${BASE_BUNDLE_SHA1}
+  if [ ! -e "$BASE_BUNDLE" ]; then
+    mkdir -p $HOME/verdi/cache
+    rm -f $HOME/verdi/cache/base-*
+    case "$BASE_BUNDLE_URL" in
+      gs://*) gsutil cp $BASE_BUNDLE_URL ${BASE_BUNDLE}.tmp ;;
+      *) aws s3 cp $BASE_BUNDLE_URL ${BASE_BUNDLE}.tmp ;;
+    esac
+    if ! echo "$BASE_BUNDLE_SHA1  ${BASE_BUNDLE}.tmp" | sha1sum -c --quiet; then
+      echo "Base bundle $BASE_BUNDLE_URL doesn't match checksum $BASE_BUNDLE_SHA1." >&2
+      rm -f ${BASE_BUNDLE}.tmp
+      exit 1
+    fi
+    mv ${BASE_BUNDLE}.tmp $BASE_BUNDLE
+  fi
+  case "$BASE_BUNDLE_URL" in
+    *.tar.zst) zstd -q -d -c $BASE_BUNDLE | tar xf - -C $BASE_PATH ;;
+    *.tgz) tar xfz $BASE_BUNDLE -C $BASE_PATH ;;
+    *) tar xfj $BASE_BUNDLE -C $BASE_PATH ;;
+  esac
+fi
+
 # move code
 #mv $BASE_PATH/<some_code> $HOME/
 
@@ -5,20 +5,339 @@ from __future__ import unicode_literals
 from __future__ import absolute_import
 from __future__ import print_function
 
-import os, json, yaml, requests, tarfile, shutil, traceback
-from fabric.api import execute, hide
-
-from prompt_toolkit.shortcuts import prompt, print_tokens
-from prompt_toolkit.styles import style_from_dict
-from prompt_toolkit.validation import Validator, ValidationError
-from pygments.token import Token
+import os, sys, io, json, tarfile, shutil, time, tempfile, threading, subprocess, hashlib
+from contextlib import contextmanager
+from urlparse import urlparse
+from multiprocessing.pool import ThreadPool
 
 from sdscli.log_utils import logger
-from sdscli.conf_utils import get_user_files_path, SettingsConf
-from sdscli.query_utils import run_query
-from sdscli.os_utils import validate_dir, normpath
+from sdscli.conf_utils import get_user_cache_path, SettingsConf
+from sdscli.query_utils import iter_query
+from sdscli import es_utils
+from sdscli.os_utils import validate_dir, normpath, sha256sum
+
+
+# default number of concurrent image transfers
+IMAGE_TRANSFER_JOBS = 4
+
+# evict cached images unused for 30 days
+IMAGE_CACHE_MAX_AGE = 30 * 24 * 60 * 60
 
-from osaka.main import get, put, rmall
+# evict least recently used cached images beyond 20 GB
+IMAGE_CACHE_MAX_SIZE = 20 * 1024 * 1024 * 1024
+
+
+def transfer_image(func, src, dest, local_path):
+    """Transfer image and return size and elapsed time of the transfer."""
+
+    t0 = time.time()
+    func(src, dest)
+    elapsed = time.time() - t0
+    size = os.path.getsize(local_path) if os.path.isfile(local_path) else 0
+    return (src, dest, local_path), size, elapsed
+
+
+def report_transfer(transfer, size, elapsed, out=None):
+    """Print throughput of a completed image transfer."""
+
+    if out is None: out = sys.stdout
+    mb = size / 1024. / 1024.
+    print("{}: {:.1f} MB in {:.1f}s ({:.1f} MB/s)".format(os.path.basename(transfer[0]),
+          mb, elapsed, mb / elapsed if elapsed > 0 else 0.), file=out)
+
+
+def iter_transfers(func, transfers, jobs=None, out=None):
+    """Run image transfers in a bounded worker pool and yield each transfer as it
+       completes, reporting per-image throughput.
+
+       Each transfer is a tuple of (src, dest, local_path) passed to func as
+       func(src, dest); local_path is the local copy of the image used to
+       compute throughput."""
+
+    if len(transfers) == 0: return
+    if jobs is None: jobs = IMAGE_TRANSFER_JOBS
+    pool = ThreadPool(max(1, min(jobs, len(transfers))))
+    try:
+        for transfer, size, elapsed in pool.imap_unordered(lambda t: transfer_image(func, *t), transfers):
+            report_transfer(transfer, size, elapsed, out)
+            yield transfer
+    finally:
+        pool.close()
+        pool.join()
+
+
+def transfer_images(func, transfers, jobs=None, out=None):
+    """Run image transfers in a bounded worker pool and report per-image throughput."""
+
+    for transfer in iter_transfers(func, transfers, jobs, out): pass
+
+
+def parse_s3_url(url, conf):
+    """Return bucket and key of s3://[<S3_ENDPOINT>/]<bucket>/<key> url."""
+
+    u = urlparse(url)
+    parts = u.path.lstrip('/').split('/', 1)
+    if u.netloc == conf.cfg.get('S3_ENDPOINT', None):
+        if len(parts) != 2:
+            raise RuntimeError("Failed to parse bucket and key from {}.".format(url))
+        return parts[0], parts[1]
+    return u.netloc, u.path.lstrip('/')
+
+
+_s3_clients = {}
+_s3_lock = threading.Lock()
+
+
+def get_s3_client(conf):
+    """Return S3 client for the configured S3_ENDPOINT and AWS_REGION; clients
+       are created once and shared across threads."""
+
+    import boto3
+    endpoint = conf.cfg.get('S3_ENDPOINT', None)
+    region = conf.cfg.get('AWS_REGION', None)
+    with _s3_lock:
+        if (endpoint, region) not in _s3_clients:
+            endpoint_url = None
+            if endpoint:
+                endpoint_url = endpoint if '://' in endpoint else "https://{}".format(endpoint)
+            _s3_clients[(endpoint, region)] = boto3.client('s3', endpoint_url=endpoint_url,
+                                                           region_name=region)
+        return _s3_clients[(endpoint, region)]
+
+
+@contextmanager
+def open_pkg_output(output, conf):
+    """Open binary output stream for package archive: local file, stdout ('-') or S3 url."""
+
+    if output == '-':
+        yield sys.stdout
+        sys.stdout.flush()
+    elif output.startswith('s3://'):
+        bucket, key = parse_s3_url(output, conf)
+        logger.debug("Streaming package to bucket {} key {}.".format(bucket, key))
+        r, w = os.pipe()
+        reader = os.fdopen(r, 'rb')
+        writer = os.fdopen(w, 'wb')
+        errors = []
+        client = get_s3_client(conf)
+        def upload():
+            try: client.upload_fileobj(reader, bucket, key)
+            except Exception as e: errors.append(e)
+            finally: reader.close()
+        t = threading.Thread(target=upload)
+        t.start()
+        try: yield writer
+        except BaseException:
+            exc_info = sys.exc_info()
+            try: writer.close()
+            except IOError: pass
+            t.join()
+
+            # a failed upload closes the pipe, so writes fail with a pipe error;
+            # raise the upload's own error instead
+            if len(errors) > 0: raise errors[0]
+
+            # the upload sees a normal EOF, so remove the truncated archive it stored
+            try: client.delete_object(Bucket=bucket, Key=key)
+            except Exception as e:
+                logger.error("Failed to remove partial package {}: {}".format(output, e))
+            raise exc_info[0], exc_info[1], exc_info[2]
+        try: writer.close()
+        except IOError: pass
+        t.join()
+        if len(errors) > 0: raise errors[0]
+    else:
+        # write to a temporary file next to output and move it into place once
+        # complete so a failed export doesn't leave a truncated package behind
+        fd, tmp_file = tempfile.mkstemp(prefix=".{}.".format(os.path.basename(output)),
+                                        dir=os.path.dirname(os.path.abspath(output)))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                yield f
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_file, 0666 & ~umask)
+            os.rename(tmp_file, output)
+        except:
+            os.unlink(tmp_file)
+            raise
+
+
+@contextmanager
+def compress_stream(fileobj, compress=None):
+    """Wrap fileobj with a zstd compressor when requested; gzip is handled by tarfile."""
+
+    if compress != 'zst':
+        yield fileobj
+        return
+    p = subprocess.Popen(['zstd', '-q', '-T0', '-c'], stdin=subprocess.PIPE, stdout=fileobj)
+    try: yield p.stdin
+    finally:
+        p.stdin.close()
+        ret = p.wait()
+    if ret != 0:
+        raise RuntimeError("zstd compression failed with exit code {}.".format(ret))
+
+
+def get_image_cache_path(url):
+    """Return path of cached image for url under the user cache."""
+
+    key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+    return os.path.join(get_user_cache_path(), 'images', key, os.path.basename(url))
+
+
+def get_remote_validator(url, conf):
+    """Return ETag and size of image at url used to validate a cached copy or
+       None if the source can't be checked."""
+
+    if url.startswith('s3://'):
+        bucket, key = parse_s3_url(url, conf)
+        res = get_s3_client(conf).head_object(Bucket=bucket, Key=key)
+        return "{}:{}".format(res.get('ETag', ''), res.get('ContentLength', ''))
+    if url.startswith('http://') or url.startswith('https://'):
+        import requests
+        r = requests.head(url, allow_redirects=True)
+        r.raise_for_status()
+        if 'ETag' not in r.headers and 'Content-Length' not in r.headers: return None
+        return "{}:{}".format(r.headers.get('ETag', ''), r.headers.get('Content-Length', ''))
+    return None
+
+
+def get_cached_digest(path, validator=None):
+    """Return digest of cached image or None if the image isn't fully cached or
+       its source changed since it was cached."""
+
+    meta_file = "{}.json".format(path)
+    if not os.path.isfile(path) or not os.path.isfile(meta_file): return None
+    with open(meta_file) as f:
+        meta = json.load(f)
+    if validator is not None and meta.get('validator', None) != validator: return None
+    return meta.get('sha256', None)
+
+
+def cache_image(url, cache_dir, validator=None):
+    """Download image into a scratch directory of the cache, then move it and
+       its metadata into place."""
+
+    from osaka.main import get
+
+    name = os.path.basename(url)
+    tmp_dir = tempfile.mkdtemp(prefix=".{}.".format(name), dir=cache_dir)
+    try:
+        get(url, tmp_dir)
+        tmp_path = os.path.join(tmp_dir, name)
+        meta = { 'url': url, 'validator': validator, 'sha256': sha256sum(tmp_path) }
+        with open("{}.json".format(tmp_path), 'w') as f:
+            json.dump(meta, f)
+        path = os.path.join(cache_dir, name)
+        os.rename(tmp_path, path)
+        os.rename("{}.json".format(tmp_path), "{}.json".format(path))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def get_dir_size(path):
+    """Return total size of files under path."""
+
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for f in files:
+            try: size += os.path.getsize(os.path.join(root, f))
+            except OSError: pass
+    return size
+
+
+def prune_image_cache(keep, max_age=IMAGE_CACHE_MAX_AGE, max_size=IMAGE_CACHE_MAX_SIZE):
+    """Remove cached images not used within max_age seconds, then least recently
+       used ones until the cache fits in max_size bytes, except those in keep."""
+
+    cache_dir = os.path.join(get_user_cache_path(), 'images')
+    if not os.path.isdir(cache_dir): return
+    now = time.time()
+    total = 0
+    entries = []
+    for key in os.listdir(cache_dir):
+        key_dir = os.path.join(cache_dir, key)
+        if not os.path.isdir(key_dir): continue
+        try: mtime = os.path.getmtime(key_dir)
+        except OSError: continue
+        size = get_dir_size(key_dir)
+        if key_dir not in keep and now - mtime > max_age:
+            logger.debug("Evicting cached image {}.".format(key_dir))
+            shutil.rmtree(key_dir, ignore_errors=True)
+            continue
+        total += size
+        if key_dir not in keep: entries.append((mtime, size, key_dir))
+    for mtime, size, key_dir in sorted(entries):
+        if total <= max_size: break
+        logger.debug("Evicting cached image {} to fit cache size.".format(key_dir))
+        shutil.rmtree(key_dir, ignore_errors=True)
+        total -= size
+
+
+def cache_images(images, conf, jobs=None, out=None):
+    """Download images missing from the user cache and return mapping of image
+       name to tuple of (cached path, digest).
+
+       Images are cached by url and reused only while the source's ETag and
+       size still match; images unused for IMAGE_CACHE_MAX_AGE or beyond
+       IMAGE_CACHE_MAX_SIZE are evicted."""
+
+    cached = {}
+    transfers = {}
+    for url, name in images:
+        path = get_image_cache_path(url)
+        cached[name] = path
+        if url in transfers: continue
+        try: validator = get_remote_validator(url, conf)
+        except Exception as e:
+            logger.warning("Failed to validate cached image for {}: {}".format(url, e))
+            validator = None
+        if validator is not None and get_cached_digest(path, validator) is not None:
+            logger.debug("Using cached image {} for {}.".format(path, url))
+            os.utime(os.path.dirname(path), None)
+            continue
+        validate_dir(os.path.dirname(path))
+        transfers[url] = (url, (os.path.dirname(path), validator), path)
+    transfer_images(lambda url, dest: cache_image(url, *dest), transfers.values(), jobs, out)
+    prune_image_cache(set(os.path.dirname(path) for path in cached.values()))
+    return dict((name, (path, get_cached_digest(path))) for name, path in cached.items())
+
+
+def iter_hysds_ios(es_url, comp, job_spec_ids):
+    """Yield hysds_ios for a set of job_spec ids with a single terms query.
+
+       Job specs that have no hysds_ios under the current mapping are looked
+       up in one follow-up query against the deprecated mapping."""
+
+    if len(job_spec_ids) == 0: return
+    found = {}
+    for hit in iter_query(es_url, "hysds_ios", {
+        "query": {
+            "terms": { "job-specification.raw": job_spec_ids }
+        }
+    }):
+        job_spec_id = hit['_source'].get('job-specification')
+        found[job_spec_id] = found.get(job_spec_id, 0) + 1
+        yield hit['_source']
+    for job_spec_id in job_spec_ids:
+        logger.debug("Found {} hysds_ios on {} for {}.".format(found.get(job_spec_id, 0), comp, job_spec_id))
+
+    # backwards-compatible query
+    missing = [i for i in job_spec_ids if i not in found]
+    if len(missing) == 0: return
+    logger.debug("Got no hysds_ios from {} for {}. Checking deprecated mappings:".format(comp, missing))
+    count = 0
+    for hit in iter_query(es_url, "hysds_ios", {
+        "query": {
+            "query_string": {
+                "query": "job-specification:({})".format(" OR ".join(['"{}"'.format(i) for i in missing]))
+            }
+        }
+    }):
+        count += 1
+        yield hit['_source']
+    logger.debug("Found {} hysds_ios on {} using deprecated mappings.".format(count, comp))
 
 
 def ls(args):
@@ -26,16 +345,17 @@ def ls(args):
 
     # get user's SDS conf settings
     conf = SettingsConf()
+    es_utils.configure_from_settings(conf)
 
     # query for containers
     es_url = "http://{}:9200".format(conf.get('MOZART_ES_PVT_IP'))
-    hits = run_query(es_url, "containers", {
+    hits = iter_query(es_url, "containers", {
         "query": {
             "match_all": {}
         }
     })
 
-    # list
+    # list as results stream in
     for hit in hits:
         logger.debug(json.dumps(hit, indent=2))
         print(hit['_id'])
@@ -45,8 +365,11 @@ def ls(args):
 def export(args):
     """Export HySDS package."""
 
+    from osaka.main import get
+
     # get user's SDS conf settings
     conf = SettingsConf()
+    es_utils.configure_from_settings(conf)
 
     # container id
     cont_id = args.id
@@ -54,15 +377,15 @@ def export(args):
     # query for container
     mozart_es_url = "http://{}:9200".format(conf.get('MOZART_ES_PVT_IP'))
     grq_es_url = "http://{}:9200".format(conf.get('GRQ_ES_PVT_IP'))
-    hits = run_query(mozart_es_url, "containers", {
+    hit = next(iter_query(mozart_es_url, "containers", {
         "query": {
             "term": { "_id": cont_id }
         }
-    })
-    if len(hits) == 0:
+    }), None)
+    if hit is None:
         logger.error("SDS package id {} not found.".format(cont_id))
         return 1
-    cont_info = hits[0]['_source']
+    cont_info = hit['_source']
     logger.debug("cont_info: {}".format(json.dumps(cont_info, indent=2)))
 
     # set export directory
@@ -71,20 +394,20 @@ def export(args):
     export_dir = os.path.join(outdir, export_name)
     logger.debug("export_dir: {}".format(export_dir))
 
+    # streaming mode writes the archive directly without a staging directory
+    stream = args.stream or args.output is not None or args.compress is not None
+
     # if directory exists, stop
-    if os.path.exists(export_dir):
+    if not stream and os.path.exists(export_dir):
         logger.error("SDS package export directory {} exists. Not continuing.".format(export_dir))
         return 1
 
-    # create export directory
-    validate_dir(export_dir)
-
-    # download container
-    get(cont_info['url'], export_dir)
+    # queue container download
+    images = [(cont_info['url'], os.path.basename(cont_info['url']))]
     cont_info['url'] = os.path.basename(cont_info['url'])
 
     # query job specs
-    job_specs = [i['_source'] for i in run_query(mozart_es_url, "job_specs", {
+    job_specs = [i['_source'] for i in iter_query(mozart_es_url, "job_specs", {
         "query": {
             "term": { "container.raw": cont_id }
         }
@@ -94,7 +417,7 @@ def export(args):
     # backwards-compatible query
     if len(job_specs) == 0:
         logger.debug("Got no job_specs. Checking deprecated mappings:")
-        job_specs = [i['_source'] for i in run_query(mozart_es_url, "job_specs", {
+        job_specs = [i['_source'] for i in iter_query(mozart_es_url, "job_specs", {
             "query": {
                 "query_string": {
                     "query": "container:\"{}\"".format(cont_id)
@@ -103,62 +426,23 @@ def export(args):
         })]
         logger.debug("job_specs: {}".format(json.dumps(job_specs, indent=2)))
 
-    # pull hysds_ios for each job_spec and download any dependency images
-    hysds_ios = []
+    # queue download of any dependency images
     dep_images = {}
     for job_spec in job_specs:
-        # download dependency images
         for d in job_spec.get('dependency_images', []):
             if d['container_image_name'] in dep_images:
                 d['container_image_url'] = dep_images[d['container_image_name']]
             else:
-                # download container
-                get(d['container_image_url'], export_dir)
-                d['container_image_url'] = os.path.basename(d['container_image_url'])
+                dep_img = os.path.basename(d['container_image_url'])
+                images.append((d['container_image_url'], dep_img))
+                d['container_image_url'] = dep_img
                 dep_images[d['container_image_name']] = d['container_image_url']
 
-
-        # collect hysds_ios from mozart
-        mozart_hysds_ios = [i['_source'] for i in run_query(mozart_es_url, "hysds_ios", {
-            "query": {
-                "term": { "job-specification.raw": job_spec['id'] }
-            }
-        })]
-        logger.debug("Found {} hysds_ios on mozart for {}.".format(len(mozart_hysds_ios), job_spec['id']))
-
-        # backwards-compatible query
-        if len(mozart_hysds_ios) == 0:
-            logger.debug("Got no hysds_ios from mozart. Checking deprecated mappings:")
-            mozart_hysds_ios = [i['_source'] for i in run_query(mozart_es_url, "hysds_ios", {
-                "query": {
-                    "query_string": {
-                        "query": "job-specification:\"{}\"".format(job_spec['id'])
-                    }
-                }
-            })]
-            logger.debug("Found {} hysds_ios on mozart for {}.".format(len(mozart_hysds_ios), job_spec['id']))
-        hysds_ios.extend(mozart_hysds_ios)
-        
-        # collect hysds_ios from grq
-        grq_hysds_ios = [i['_source'] for i in run_query(grq_es_url, "hysds_ios", {
-            "query": {
-                "term": { "job-specification.raw": job_spec['id'] }
-            }
-        })]
-        logger.debug("Found {} hysds_ios on grq for {}.".format(len(grq_hysds_ios), job_spec['id']))
-
-        # backwards-compatible query
-        if len(mozart_hysds_ios) == 0:
-            logger.debug("Got no hysds_ios from grq. Checking deprecated mappings:")
-            grq_hysds_ios = [i['_source'] for i in run_query(grq_es_url, "hysds_ios", {
-                "query": {
-                    "query_string": {
-                        "query": "job-specification:\"{}\"".format(job_spec['id'])
-                    }
-                }
-            })]
-            logger.debug("Found {} hysds_ios on grq for {}.".format(len(grq_hysds_ios), job_spec['id']))
-        hysds_ios.extend(grq_hysds_ios)
+    # collect hysds_ios for all job_specs from mozart and grq
+    job_spec_ids = [i['id'] for i in job_specs]
+    hysds_ios = []
+    for comp, es_url in [('mozart', mozart_es_url), ('grq', grq_es_url)]:
+        hysds_ios.extend(iter_hysds_ios(es_url, comp, job_spec_ids))
     logger.debug("Found {} hysds_ios total.".format(len(hysds_ios)))
 
     # export allowed accounts
@@ -167,12 +451,38 @@ def export(args):
             if 'allowed_accounts' in hysds_io:
                 del hysds_io['allowed_accounts']
 
-    # dump manifest JSON
+    # build manifest
     manifest = {
         "containers" : cont_info,
         "job_specs": job_specs,
         "hysds_ios": hysds_ios,
     }
+
+    # report throughput to stderr when archive goes to stdout
+    report = sys.stderr if args.output == '-' else sys.stdout
+
+    # download images into user cache and record their digests
+    cached = None
+    if args.cache:
+        cached = cache_images(images, conf, args.jobs, report)
+        manifest['image_digests'] = dict((name, digest) for name, (path, digest) in cached.items())
+
+    if stream:
+        return export_stream(args, conf, export_name, manifest, images, cached, report)
+
+    # create export directory
+    validate_dir(export_dir)
+
+    # download container and dependency images or link them from the cache
+    if cached is None:
+        transfer_images(get, [(url, export_dir, os.path.join(export_dir, name)) for url, name in images],
+                        args.jobs, report)
+    else:
+        for name, (path, digest) in cached.items():
+            try: os.link(path, os.path.join(export_dir, name))
+            except OSError: shutil.copy(path, os.path.join(export_dir, name))
+
+    # dump manifest JSON
     manifest_file = os.path.join(export_dir, 'manifest.json')
     with open(manifest_file, 'w') as f:
         json.dump(manifest, f, indent=2, sort_keys=True)
@@ -186,38 +496,153 @@ def export(args):
     shutil.rmtree(export_dir)
 
 
+def export_stream(args, conf, export_name, manifest, images, cached=None, report=None):
+    """Stream HySDS package archive to a file, stdout or S3 url.
+
+       The manifest is written as the first member. Cached images are added
+       straight from the user cache; otherwise each image is added to the
+       archive and removed from local disk as soon as its download completes."""
+
+    from osaka.main import get
+
+    # resolve output
+    output = args.output
+    if output is None:
+        ext = { None: "", 'gz': ".gz", 'zst': ".zst" }[args.compress]
+        output = os.path.join(normpath(args.outdir), "{}.tar{}".format(export_name, ext))
+    elif output != '-' and not output.startswith('s3://'):
+        output = normpath(output)
+    logger.debug("output: {}".format(output))
+
+    # download uncached images to a scratch directory under the output directory
+    tmp_dir = None
+    if cached is None:
+        tmp_dir = tempfile.mkdtemp(prefix="{}.".format(export_name), dir=normpath(args.outdir))
+    try:
+        with open_pkg_output(output, conf) as out:
+            with compress_stream(out, args.compress) as cout:
+                mode = "w|gz" if args.compress == 'gz' else "w|"
+                with tarfile.open(fileobj=cout, mode=mode) as tar:
+
+                    # package directory and manifest
+                    dir_info = tarfile.TarInfo(export_name)
+                    dir_info.type = tarfile.DIRTYPE
+                    dir_info.mode = 0755
+                    dir_info.mtime = time.time()
+                    tar.addfile(dir_info)
+                    manifest_str = json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8')
+                    manifest_info = tarfile.TarInfo(os.path.join(export_name, 'manifest.json'))
+                    manifest_info.size = len(manifest_str)
+                    manifest_info.mode = 0644
+                    manifest_info.mtime = time.time()
+                    tar.addfile(manifest_info, io.BytesIO(manifest_str))
+
+                    # add cached images
+                    if cached is not None:
+                        for url, name in images:
+                            tar.add(cached[name][0], arcname=os.path.join(export_name, name))
+                        return
+
+                    # stream images into archive as they arrive
+                    transfers = [(url, tmp_dir, os.path.join(tmp_dir, name)) for url, name in images]
+                    for url, dest, local_path in iter_transfers(get, transfers, args.jobs, report):
+                        tar.add(local_path, arcname=os.path.join(export_name, os.path.basename(local_path)))
+                        os.unlink(local_path)
+    finally:
+        if tmp_dir is not None: shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+@contextmanager
+def open_pkg_input(tar_file):
+    """Open binary input stream for package archive: local file or stdin ('-').
+
+       Archives ending in .zst are decompressed through the zstd CLI; gzip
+       is handled by tarfile."""
+
+    f = sys.stdin if tar_file == '-' else open(tar_file, 'rb')
+    try:
+        if tar_file.endswith('.zst'):
+            p = subprocess.Popen(['zstd', '-q', '-d', '-c'], stdin=f, stdout=subprocess.PIPE)
+            try: yield p.stdout
+            finally:
+                p.stdout.close()
+                p.wait()
+        else: yield f
+    finally:
+        if f is not sys.stdin: f.close()
+
+
+def resolve_image_urls(manifest, code_bucket_url):
+    """Rewrite image urls in manifest to the code bucket and return mapping of
+       archive image name to upload url."""
+
+    cont_info = manifest['containers']
+    uploads = { cont_info['url']: "{}/{}".format(code_bucket_url, cont_info['url']) }
+    cont_info['url'] = uploads[cont_info['url']]
+    dep_images = {}
+    for job_spec in manifest['job_specs']:
+        for d in job_spec.get('dependency_images', []):
+            if d['container_image_name'] in dep_images:
+                d['container_image_url'] = dep_images[d['container_image_name']]
+            else:
+                dep_img = d['container_image_url']
+                d['container_image_url'] = "{}/{}".format(code_bucket_url, dep_img)
+                uploads[dep_img] = d['container_image_url']
+                dep_images[d['container_image_name']] = d['container_image_url']
+    return uploads
+
+
+def get_remote_digest(dest_url, conf):
+    """Return sha256 metadata of object at S3 url or None if it doesn't exist."""
+
+    from botocore.exceptions import ClientError
+    bucket, key = parse_s3_url(dest_url, conf)
+    try: res = get_s3_client(conf).head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'): return None
+        raise
+    return res.get('Metadata', {}).get('sha256', None)
+
+
+def is_uploaded(name, dest_url, digests, conf):
+    """Return True if code bucket already holds an image with the same digest."""
+
+    digest = digests.get(name, None)
+    if digest is None: return False
+    if get_remote_digest(dest_url, conf) != digest: return False
+    print("{}: unchanged (sha256 {}), skipping upload".format(name, digest[:12]))
+    return True
+
+
+def upload_fileobj(fileobj, dest_url, conf, digest=None):
+    """Upload file object to S3 url, tagging it with its sha256 digest."""
+
+    bucket, key = parse_s3_url(dest_url, conf)
+    extra_args = None if digest is None else { 'Metadata': { 'sha256': digest } }
+    get_s3_client(conf).upload_fileobj(fileobj, bucket, key, ExtraArgs=extra_args)
+
+
+def upload_file(path, dest_url, conf, digest=None):
+    """Upload local file to S3 url, tagging it with its sha256 digest."""
+
+    with open(path, 'rb') as f:
+        upload_fileobj(f, dest_url, conf, digest)
+
+
 def import_pkg(args):
     """Import HySDS package."""
 
     # get user's SDS conf settings
     conf = SettingsConf()
+    es_utils.configure_from_settings(conf)
 
     # package tar file
-    tar_file = normpath(args.file)
-    if not os.path.isfile(tar_file):
+    tar_file = args.file if args.file == '-' else normpath(args.file)
+    if tar_file != '-' and not os.path.isfile(tar_file):
         logger.error("HySDS package file {} doesn't exist.".format(tar_file))
         return 1
     logger.debug("tar_file: {}".format(tar_file))
 
-    # extract
-    outdir = os.path.dirname(tar_file)
-    with tarfile.open(tar_file) as tar:
-        export_name = tar.getnames()[0]
-        tar.extractall(outdir)
-    export_dir = os.path.join(outdir, export_name)
-    logger.debug("export_dir: {}".format(export_dir))
-
-    # detect export dir
-    if not os.path.isdir(export_dir):
-        logger.error("Cannot find HySDS package dir {}.".format(export_dir))
-        return 1
-
-    # read in manifest
-    manifest_file = os.path.join(export_dir, 'manifest.json')
-    with open(manifest_file) as f:
-        manifest = json.load(f)
-    logger.debug("manifest: {}".format(json.dumps(manifest, indent=2, sort_keys=True)))
-
     # get code bucket
     code_bucket = conf.get('CODE_BUCKET')
     code_bucket_url = "s3://{}/{}".format(conf.get('S3_ENDPOINT'), code_bucket)
@@ -228,53 +653,117 @@ def import_pkg(args):
     mozart_es_url = "http://{}:9200".format(conf.get('MOZART_ES_PVT_IP'))
     grq_es_url = "http://{}:9200".format(conf.get('GRQ_ES_PVT_IP'))
 
-
-    # upload container image and index container in ES
+    # stream archive: read the manifest, then spool each image to a scratch
+    # directory and upload it in a bounded worker pool while the next one is
+    # read; at most jobs images are spooled at a time once the manifest is read
+    # and images stored ahead of the manifest (older exports) are held until then
+    manifest = None
+    uploads = {}
+    digests = {}
+    uploaded = set()
+    spooled = []
+    jobs = max(1, args.jobs or IMAGE_TRANSFER_JOBS)
+    pool = ThreadPool(jobs)
+    slots = threading.BoundedSemaphore(jobs)
+    results = []
+    tmp_dir = None
+
+    def upload_spooled(name, path):
+        try:
+            return transfer_image(lambda src, dest: upload_file(src, dest, conf, digests.get(name, None)),
+                                  path, uploads[name], path)
+        finally:
+            os.unlink(path)
+            slots.release()
+
+    def submit(name, path):
+        uploaded.add(name)
+        if is_uploaded(name, uploads[name], digests, conf):
+            os.unlink(path)
+            return
+        slots.acquire()
+
+        # stop reading the archive once an upload has failed
+        for res in results:
+            if res.ready() and not res.successful(): res.get()
+        results.append(pool.apply_async(upload_spooled, (name, path),
+                                        callback=lambda res: report_transfer(*res)))
+
+    try:
+        with open_pkg_input(tar_file) as f:
+            with tarfile.open(fileobj=f, mode="r|*") as tar:
+                for member in tar:
+                    if not member.isfile(): continue
+                    name = os.path.basename(member.name)
+                    if name == 'manifest.json':
+                        manifest = json.load(tar.extractfile(member))
+                        logger.debug("manifest: {}".format(json.dumps(manifest, indent=2, sort_keys=True)))
+                        uploads = resolve_image_urls(manifest, code_bucket_url)
+                        digests = manifest.get('image_digests', {})
+                        for spooled_name, path in spooled:
+                            if spooled_name in uploads: submit(spooled_name, path)
+                        continue
+                    if manifest is not None and name not in uploads:
+                        logger.warning("Skipping {} not referenced in manifest.".format(member.name))
+                        continue
+                    if tmp_dir is None:
+                        tmp_dir = tempfile.mkdtemp(prefix="sdspkg.",
+                            dir=None if tar_file == '-' else os.path.dirname(tar_file))
+                    tar.extract(member, tmp_dir)
+                    path = os.path.join(tmp_dir, member.name)
+                    if manifest is None:
+                        logger.debug("Spooling {} until manifest is read.".format(member.name))
+                        spooled.append((name, path))
+                    else: submit(name, path)
+
+        # detect manifest
+        if manifest is None:
+            logger.error("Cannot find manifest in HySDS package {}.".format(tar_file))
+            return 1
+
+        # wait for uploads and raise the first failure
+        for res in results: res.get()
+    finally:
+        pool.close()
+        pool.join()
+        if tmp_dir is not None: shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    # detect missing images
+    missing = [i for i in uploads if i not in uploaded]
+    if len(missing) > 0:
+        logger.error("Images missing from HySDS package: {}".format(", ".join(missing)))
+        return 1
     cont_info = manifest['containers']
-    cont_image = os.path.join(export_dir, cont_info['url'])
-    cont_info['url'] = "{}/{}".format(code_bucket_url, cont_info['url'])
-    put(cont_image, cont_info['url'])
-    r = requests.put("{}/containers/container/{}".format(mozart_es_url, cont_info['id']),
-                     data=json.dumps(cont_info))
-    r.raise_for_status()
-    logger.debug(r.json())
 
-    # index job_specs in ES and upload any dependency containers
-    dep_images = {}
-    for job_spec in manifest['job_specs']:
-        # download dependency images
-        for d in job_spec.get('dependency_images', []):
-            if d['container_image_name'] in dep_images:
-                d['container_image_url'] = dep_images[d['container_image_name']]
-            else:
-                # upload container
-                dep_img = os.path.join(export_dir, d['container_image_url'])
-                d['container_image_url'] = "{}/{}".format(code_bucket_url, d['container_image_url'])
-                put(dep_img, d['container_image_url'])
-                dep_images[d['container_image_name']] = d['container_image_url']
-        r = requests.put("{}/job_specs/job_spec/{}".format(mozart_es_url, job_spec['id']),
-                         data=json.dumps(job_spec))
-        r.raise_for_status()
-        logger.debug(r.json())
+    # bulk index container and job_specs in mozart ES
+    mozart_docs = [("containers", "container", cont_info['id'], cont_info)]
+    mozart_docs.extend(("job_specs", "job_spec", i['id'], i) for i in manifest['job_specs'])
 
-    # index hysds_ios in ES
+    # bulk index hysds_ios in mozart or grq ES
+    grq_docs = []
     for hysds_io in manifest['hysds_ios']:
         component = hysds_io.get('component', 'tosca')
-        es_url = mozart_es_url if component == 'mozart' else grq_es_url
-        r = requests.put("{}/hysds_ios/hysds_io/{}".format(es_url, hysds_io['id']),
-                         data=json.dumps(hysds_io))
-        r.raise_for_status()
-        logger.debug(r.json())
-
-    # remove package dir
-    shutil.rmtree(export_dir)
+        docs = mozart_docs if component == 'mozart' else grq_docs
+        docs.append(("hysds_ios", "hysds_io", hysds_io['id'], hysds_io))
+    failures = []
+    for comp, es_url, docs in [('mozart', mozart_es_url, mozart_docs), ('grq', grq_es_url, grq_docs)]:
+        count, comp_failures = es_utils.bulk_index(es_url, docs)
+        logger.debug("Indexed {} docs on {}.".format(count, comp))
+        failures.extend(comp_failures)
+
+    if len(failures) > 0:
+        logger.error("Failed to index {} docs from HySDS package.".format(len(failures)))
+        return 1
 
 
 def rm(args):
     """Remove HySDS package."""
 
+    from osaka.main import rmall
+
     # get user's SDS conf settings
     conf = SettingsConf()
+    es_utils.configure_from_settings(conf)
 
     # container id
     cont_id = args.id
@@ -282,25 +771,25 @@ def rm(args):
     # query for container
     mozart_es_url = "http://{}:9200".format(conf.get('MOZART_ES_PVT_IP'))
     grq_es_url = "http://{}:9200".format(conf.get('GRQ_ES_PVT_IP'))
-    hits = run_query(mozart_es_url, "containers", {
+    hit = next(iter_query(mozart_es_url, "containers", {
         "query": {
             "term": { "_id": cont_id }
         }
-    })
-    if len(hits) == 0:
+    }), None)
+    if hit is None:
         logger.error("SDS package id {} not found.".format(cont_id))
         return 1
-    cont_info = hits[0]['_source']
+    cont_info = hit['_source']
     logger.debug("cont_info: {}".format(json.dumps(cont_info, indent=2)))
 
     # delete container from code bucket and ES
     rmall(cont_info['url'])
-    r = requests.delete("{}/containers/container/{}".format(mozart_es_url, cont_info['id']))
+    r = es_utils.delete("{}/containers/container/{}".format(mozart_es_url, cont_info['id']))
     r.raise_for_status()
     logger.debug(r.json())
 
     # query job specs
-    job_specs = [i['_source'] for i in run_query(mozart_es_url, "job_specs", {
+    job_specs = [i['_source'] for i in iter_query(mozart_es_url, "job_specs", {
         "query": {
             "term": { "container.raw": cont_id }
         }
@@ -310,30 +799,30 @@ def rm(args):
     # delete job_specs and hysds_ios
     for job_spec in job_specs:
         # collect hysds_ios from mozart
-        mozart_hysds_ios = [i['_source'] for i in run_query(mozart_es_url, "hysds_ios", {
+        mozart_hysds_ios = [i['_source'] for i in iter_query(mozart_es_url, "hysds_ios", {
             "query": {
                 "term": { "job-specification.raw": job_spec['id'] }
             }
         })]
         logger.debug("Found {} hysds_ios on mozart for {}.".format(len(mozart_hysds_ios), job_spec['id']))
         for hysds_io in mozart_hysds_ios:
-            r = requests.delete("{}/hysds_ios/hysds_io/{}".format(mozart_es_url, hysds_io['id']))
+            r = es_utils.delete("{}/hysds_ios/hysds_io/{}".format(mozart_es_url, hysds_io['id']))
             r.raise_for_status()
             logger.debug(r.json())
         
         # collect hysds_ios from mozart
-        grq_hysds_ios = [i['_source'] for i in run_query(grq_es_url, "hysds_ios", {
+        grq_hysds_ios = [i['_source'] for i in iter_query(grq_es_url, "hysds_ios", {
             "query": {
                 "term": { "job-specification.raw": job_spec['id'] }
             }
         })]
         logger.debug("Found {} hysds_ios on grq for {}.".format(len(grq_hysds_ios), job_spec['id']))
         for hysds_io in grq_hysds_ios:
-            r = requests.delete("{}/hysds_ios/hysds_io/{}".format(grq_es_url, hysds_io['id']))
+            r = es_utils.delete("{}/hysds_ios/hysds_io/{}".format(grq_es_url, hysds_io['id']))
             r.raise_for_status()
             logger.debug(r.json())
 
         # delete job_spec from ES
-        r = requests.delete("{}/job_specs/job_spec/{}".format(mozart_es_url, job_spec['id']))
+        r = es_utils.delete("{}/job_specs/job_spec/{}".format(mozart_es_url, job_spec['id']))
         r.raise_for_status()
         logger.debug(r.json())
@@ -6,7 +6,7 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import os, yaml, pwd, hashlib, traceback
-from fabric.api import execute, hide
+from fabric.api import hide
 from tqdm import tqdm
 
 from prompt_toolkit.shortcuts import prompt, print_tokens
@@ -20,6 +20,7 @@ from sdscli.os_utils import validate_dir
 from sdscli.prompt_utils import YesNoValidator, set_bar_desc
 
 from . import fabfile as fab
+from .fabfile import execute
 
 
 prompt_style = style_from_dict({
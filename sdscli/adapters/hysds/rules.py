@@ -5,42 +5,45 @@ from __future__ import unicode_literals
 from __future__ import absolute_import
 from __future__ import print_function
 
-import os, json, yaml, requests, tarfile, shutil, traceback
-from fabric.api import execute, hide
-
-from prompt_toolkit.shortcuts import prompt, print_tokens
-from prompt_toolkit.styles import style_from_dict
-from prompt_toolkit.validation import Validator, ValidationError
-from pygments.token import Token
+import os, json, yaml, tarfile, shutil, tempfile, traceback
 
 from sdscli.log_utils import logger
 from sdscli.conf_utils import get_user_files_path, SettingsConf
-from sdscli.query_utils import run_query
+from sdscli.query_utils import iter_query
+from sdscli import es_utils
 from sdscli.os_utils import validate_dir, normpath
 
 
-def export(args):
-    """Export HySDS user rules."""
-
-    # get user's SDS conf settings
-    conf = SettingsConf()
+def write_rules(f, es_urls):
+    """Stream user rules of each (component, ES url) into file as JSON."""
 
-    # query for mozart and grq rules
-    mozart_es_url = "http://{}:9200".format(conf.get('MOZART_ES_PVT_IP'))
-    grq_es_url = "http://{}:9200".format(conf.get('GRQ_ES_PVT_IP'))
-    rules = {}
-    for comp, es_url in [('mozart', mozart_es_url), ('grq', grq_es_url)]:
-        hits = run_query(es_url, "user_rules", {
+    f.write('{')
+    for i, (comp, es_url) in enumerate(es_urls):
+        f.write('{}\n  {}: ['.format(',' if i > 0 else '', json.dumps(comp)))
+        count = 0
+        for hit in iter_query(es_url, "user_rules", {
             "query": {
                 "match_all": {}
             }
-        }, doc_type=".percolator")
-        if len(hits) == 0:
+        }, doc_type=".percolator"):
+            rule = json.dumps(hit['_source'], indent=2, sort_keys=True)
+            logger.debug("rule: {}".format(rule))
+            f.write('{}\n    {}'.format(',' if count > 0 else '',
+                                        rule.replace('\n', '\n    ')))
+            count += 1
+        if count == 0:
             logger.error("No user rules found on {}.".format(comp))
-            rules[comp] = []
-        else:
-            rules[comp] = [i['_source'] for i in hits]
-    logger.debug("rules: {}".format(json.dumps(rules, indent=2)))
+            f.write(']')
+        else: f.write('\n  ]')
+    f.write('\n}\n')
+
+
+def export(args):
+    """Export HySDS user rules."""
+
+    # get user's SDS conf settings
+    conf = SettingsConf()
+    es_utils.configure_from_settings(conf)
 
     # set export directory
     outfile = normpath(args.outfile)
@@ -50,9 +53,21 @@ def export(args):
     # create export directory
     validate_dir(export_dir)
 
-    # dump user rules JSON
-    with open(outfile, 'w') as f:
-        json.dump(rules, f, indent=2, sort_keys=True)
+    # stream mozart and grq rules into user rules JSON; write a temp file and
+    # rename it into place so a failed scan can't leave a truncated export
+    mozart_es_url = "http://{}:9200".format(conf.get('MOZART_ES_PVT_IP'))
+    grq_es_url = "http://{}:9200".format(conf.get('GRQ_ES_PVT_IP'))
+    fd, tmp_file = tempfile.mkstemp(prefix=".{}.".format(os.path.basename(outfile)), dir=export_dir)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            write_rules(f, [('grq', grq_es_url), ('mozart', mozart_es_url)])
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_file, 0666 & ~umask)
+        os.rename(tmp_file, outfile)
+    except:
+        os.unlink(tmp_file)
+        raise
 
 
 def import_rules(args):
@@ -60,6 +75,7 @@ def import_rules(args):
 
     # get user's SDS conf settings
     conf = SettingsConf()
+    es_utils.configure_from_settings(conf)
 
     # user rules JSON file
     rules_file = normpath(args.file)
@@ -77,11 +93,13 @@ def import_rules(args):
     mozart_es_url = "http://{}:9200".format(conf.get('MOZART_ES_PVT_IP'))
     grq_es_url = "http://{}:9200".format(conf.get('GRQ_ES_PVT_IP'))
 
-    # index user rules in ES
+    # bulk index user rules in ES
+    failures = []
     for comp, es_url in [('mozart', mozart_es_url), ('grq', grq_es_url)]:
-        for rule in rules[comp]:
-            r = requests.post("{}/user_rules/.percolator/".format(es_url),
-                              data=json.dumps(rule))
-            logger.debug(r.content)
-            r.raise_for_status()
-            logger.debug(r.json())
+        docs = [("user_rules", ".percolator", None, rule) for rule in rules[comp]]
+        count, comp_failures = es_utils.bulk_index(es_url, docs)
+        logger.debug("Indexed {} user rules on {}.".format(count, comp))
+        failures.extend(comp_failures)
+    if len(failures) > 0:
+        logger.error("Failed to import {} user rules.".format(len(failures)))
+        return 1
@@ -5,160 +5,567 @@ from __future__ import unicode_literals
 from __future__ import absolute_import
 from __future__ import print_function
 
-import os, yaml, pwd, hashlib, traceback, requests, re
-from fabric.api import execute, hide
-from tqdm import tqdm
-
-from prompt_toolkit.shortcuts import prompt, print_tokens
-from prompt_toolkit.styles import style_from_dict
-from prompt_toolkit.validation import Validator, ValidationError
-from pygments.token import Token
-
-import kombu, redis, elasticsearch
+import sys, json, traceback, re, time, signal
+from datetime import datetime
+from Queue import Empty
+from multiprocessing import Process, Queue
+from fabric.api import hide, settings, env
 
 from sdscli.log_utils import logger
-from sdscli.conf_utils import get_user_files_path, SettingsConf
-from sdscli.os_utils import validate_dir
+from sdscli.conf_utils import SettingsConf
 from sdscli.prompt_utils import (highlight, blink, print_component_header,
 print_tps_header, print_supervisor_header)
 
 from . import fabfile as fab
+from .fabfile import execute
+
+
+def print_service_status(service, ret, debug=False):
+    """Print status of service based on systemctl status message."""
+
+    stdout = ret[ret.keys()[0]]
+    status_match = re.search(r'Active:\s+(.+?)\s+', stdout or '')
+    if not status_match:
+        print("{}: {}".format(service, blink(highlight("UNKNOWN", 'red'))))
+        print(stdout)
+        return
+    status = status_match.group(1)
+    if status == 'active':
+        print("{}: {}".format(service, highlight(status.upper())))
+    else:
+        print("{}: {}".format(service, blink(highlight(status.upper(), 'red'))))
+    if debug: print(stdout)
+
+
+# components in status display order and the third-party services probed on each
+STATUS_COMPS = ['grq', 'mozart', 'metrics', 'factotum', 'ci', 'verdi']
+TPS_SERVICES = {
+    'mozart': ['rabbitmq-server', 'redis', 'elasticsearch'],
+    'metrics': ['redis', 'elasticsearch'],
+    'grq': ['elasticsearch'],
+    'ci': ['jenkins'],
+}
+
+# per-probe timeout in seconds
+PROBE_TIMEOUT = 30
+
+
+# connect timeout in seconds of direct protocol probes
+DIRECT_CONNECT_TIMEOUT = 5
+
+# direct probe clients reused across polls of the same process, which only
+# helps watch mode since plain status runs each probe in a new process; client
+# libraries are imported by each probe so plain status doesn't load them
+_clients = {}
 
 
-prompt_style = style_from_dict({
-    Token.Alert: 'bg:#D8060C',
-    Token.Username: '#D8060C',
-    Token.Param: '#3CFF33',
-})
+def get_client(key, factory):
+    """Return cached direct probe client, creating it on first use."""
 
+    client = _clients.get(key, None)
+    if client is None:
+        client = factory()
+        _clients[key] = client
+    return client
 
-def print_rabbitmq_status(user, password, host):
-    """Print status of RabbitMQ server."""
 
+def format_uptime(secs):
+    """Format uptime in seconds like supervisorctl does."""
+
+    if secs is None: return None
+    days, secs = divmod(int(secs), 86400)
+    hours, secs = divmod(secs, 3600)
+    mins, secs = divmod(secs, 60)
+    uptime = "{}:{:02d}:{:02d}".format(hours, mins, secs)
+    if days > 0: uptime = "{} days, {}".format(days, uptime)
+    return uptime
+
+
+def probe_rabbitmq(conf, comp, host, timeout):
+    """Check RabbitMQ over AMQP and get queue depths from its management API."""
+
+    import kombu, requests
+
+    user = conf.get('MOZART_RABBIT_USER')
+    password = conf.get('MOZART_RABBIT_PASSWORD')
     amqp_url = "amqp://{user}:{password}@{host}:5672//".format(
         user=user,
         password=password,
         host=host)
-    logger.debug("amqp_url: {}".format(amqp_url))
+    conn = get_client(('amqp', host), lambda: kombu.Connection(amqp_url, connect_timeout=timeout))
+    conn.ensure_connection(max_retries=1)
+    details = {}
     try:
-        conn = kombu.Connection(amqp_url)
-        conn.ensure_connection(max_retries=3)
-        print("RabbitMQ: ", highlight("RUNNING"))
+        r = requests.get("http://{}:15672/api/queues".format(host), auth=(user, password),
+                         timeout=timeout)
+        r.raise_for_status()
+        details['queues'] = { q['name']: q.get('messages', 0) for q in r.json() }
     except Exception, e:
-        print("RabbitMQ: ", blink(highlight("NOT RUNNING", 'red', True)))
-        print(e)
+        details['queues'] = "unavailable: {}".format(e)
+    return { "pid": None, "uptime": None, "details": details }
 
 
-def print_redis_status(password, host):
-    """Print status of redis server."""
+def probe_redis(conf, comp, host, timeout):
+    """Check redis with INFO and report its memory use."""
 
-    try:
-        r = redis.StrictRedis(host, password=password)
-        r.ping()
-        print("Redis: ", highlight("RUNNING"))
-    except Exception, e:
-        print("Redis: ", blink(highlight("NOT RUNNING", 'red', True)))
-        print(e)
+    import redis
 
+    password = conf.get('{}_REDIS_PASSWORD'.format(comp.upper())) or ''
+    r = get_client(('redis', host), lambda: redis.StrictRedis(host, password=password,
+                   socket_connect_timeout=timeout, socket_timeout=timeout))
+    info = r.info()
+    return {
+        "pid": info.get('process_id', None),
+        "uptime": format_uptime(info.get('uptime_in_seconds', None)),
+        "details": {
+            "used_memory": info.get('used_memory_human', None),
+            "used_memory_peak": info.get('used_memory_peak_human', None),
+            "connected_clients": info.get('connected_clients', None),
+        },
+    }
 
-def print_es_status(host):
-    """Print status of ES server."""
 
-    try:
-        es = elasticsearch.Elasticsearch([host], verify_certs=False)
-        es.ping()
-        print("ES: ", highlight("RUNNING"))
-    except Exception, e:
-        print("ES: ", blink(highlight("NOT RUNNING", 'red', True)))
-        print(e)
+def probe_es(conf, comp, host, timeout):
+    """Check ES cluster health; yellow health is reported as degraded and red as failed."""
 
+    import elasticsearch
 
-def print_http_status(server, url):
-    """Print status of HTTP-based server."""
+    es = get_client(('es', host), lambda: elasticsearch.Elasticsearch([host], verify_certs=False,
+                    timeout=timeout, max_retries=0))
+    health = es.cluster.health()
+    keys = ('status', 'number_of_nodes', 'active_shards', 'relocating_shards', 'unassigned_shards')
+    status = health.get('status', None)
+    if status == 'green': state, error = "running", None
+    else:
+        state = "degraded" if status == 'yellow' else "failed"
+        error = "Cluster health is {}.".format(status)
+    return { "state": state, "error": error, "pid": None, "uptime": None,
+             "details": { k: health.get(k, None) for k in keys } }
 
-    try:
-        r = requests.get(url, verify=False)
-        r.raise_for_status()
-        print("{}: {}".format(server, highlight("RUNNING")))
-    except Exception, e:
-        print("{}: {}".format(server, blink(highlight("NOT RUNNING", 'red', True))))
-        print(e)
 
+def probe_jenkins(conf, comp, host, timeout):
+    """Check Jenkins over HTTP."""
 
-def print_service_status(service, ret, debug=False):
-    """Print status of service based on systemctl status message."""
+    import requests
 
-    stdout = ret[ret.keys()[0]]
-    status_match = re.search(r'Active:\s+(.+?)\s+', stdout)
-    if not status_match:
-        raise RuntimeError("Failed to extract status of {} from stdout:\n{}".format(service, stdout))
-    status = status_match.group(1)
-    if status == 'active':
-        print("{}: {}".format(service, highlight(status.upper())))
-    else:
-        print("{}: {}".format(service, blink(highlight(status.upper(), 'red'))))
-    if debug: print(stdout)
+    r = requests.get("http://{}:8080".format(host), verify=False, timeout=timeout)
+    r.raise_for_status()
+    return { "pid": None, "uptime": None, "details": {} }
 
 
-def print_tps_status(conf, comp, debug=False):
-    """Print status of third-party services."""
-
-    if comp == 'mozart':
-        print_tps_header(comp)
-        #print_rabbitmq_status(conf.get('MOZART_RABBIT_USER'),
-        #                      conf.get('MOZART_RABBIT_PASSWORD'),
-        #                      conf.get('MOZART_RABBIT_PVT_IP'))
-        ret = execute(fab.systemctl, 'status', 'rabbitmq-server', roles=[comp])
-        print_service_status('rabbitmq-server', ret, debug)
-        #print_redis_status(conf.get('MOZART_REDIS_PASSWORD'),
-        #                   conf.get('MOZART_REDIS_PVT_IP'))
-        ret = execute(fab.systemctl, 'status', 'redis', roles=[comp])
-        print_service_status('redis', ret, debug)
-        #print_es_status(conf.get('MOZART_ES_PVT_IP'))
-        ret = execute(fab.systemctl, 'status', 'elasticsearch', roles=[comp])
-        print_service_status('elasticsearch', ret, debug)
-    elif comp == 'metrics':
-        print_tps_header(comp)
-        #print_redis_status(conf.get('METRICS_REDIS_PASSWORD'),
-        #                   conf.get('METRICS_REDIS_PVT_IP'))
-        ret = execute(fab.systemctl, 'status', 'redis', roles=[comp])
-        print_service_status('redis', ret, debug)
-        #print_es_status(conf.get('METRICS_ES_PVT_IP')) # ES accessible only from localhost
-        ret = execute(fab.systemctl, 'status', 'elasticsearch', roles=[comp])
-        print_service_status('elasticsearch', ret, debug)
-    elif comp == 'grq':
-        print_tps_header(comp)
-        #print_es_status(conf.get('GRQ_ES_PVT_IP'))
-        ret = execute(fab.systemctl, 'status', 'elasticsearch', roles=[comp])
-        print_service_status('elasticsearch', ret, debug)
-    elif comp == 'ci':
-        print_tps_header(comp)
-        #print_http_status("Jenkins", "http://{}:8080".format(conf.get('CI_PVT_IP')))
-        ret = execute(fab.systemctl, 'status', 'jenkins', roles=[comp])
-        print_service_status('jenkins', ret, debug)
-
-
-def print_status(conf, comp, debug=False):
-    """"Status of component."""
+# direct protocol probes of third-party services, the config key of their host
+# and the key of their cached client
+DIRECT_PROBES = {
+    'rabbitmq-server': (probe_rabbitmq, 'MOZART_RABBIT_PVT_IP', 'amqp'),
+    'redis': (probe_redis, '{}_REDIS_PVT_IP', 'redis'),
+    'elasticsearch': (probe_es, '{}_ES_PVT_IP', 'es'),
+    'jenkins': (probe_jenkins, 'CI_PVT_IP', None),
+}
 
-    print_component_header(comp)
-    print_tps_status(conf, comp, debug)
-    print_supervisor_header(comp)
-    execute(fab.status, roles=[comp])
+# services only listening on their node's loopback interface, probed with systemctl
+LOCAL_SERVICES = [('metrics', 'elasticsearch')]
 
 
-def status_comp(comp, conf, debug=False):
-    """Update component."""
+def get_direct_host(conf, comp, service):
+    """Return host of directly probed service or None if it can't be reached
+       from the control host."""
 
-    if comp in ('all', 'grq'): print_status(conf, 'grq', debug)
-    if comp in ('all', 'mozart'): print_status(conf, 'mozart', debug)
-    if comp in ('all', 'metrics'): print_status(conf, 'metrics', debug)
-    if comp in ('all', 'factotum'): print_status(conf, 'factotum', debug)
-    if comp in ('all', 'ci'): print_status(conf, 'ci', debug)
-    if comp in ('all', 'verdi'): print_status(conf, 'verdi', debug)
+    if (comp, service) in LOCAL_SERVICES: return None
+    host = conf.get(DIRECT_PROBES[service][1].format(comp.upper()))
+    if not host or host == 'localhost' or host.startswith('127.'): return None
+    return host
 
 
-def status(comp, debug=False):
+def probe_direct(conf, comp, service, host, timeout):
+    """Probe third-party service from the control host and return its info keyed by host."""
+
+    func, host_key, client_key = DIRECT_PROBES[service]
+    timeout = min(timeout, DIRECT_CONNECT_TIMEOUT)
+    try:
+        info = func(conf, comp, host, timeout)
+        info.setdefault('state', "running")
+        info.setdefault('error', None)
+    except Exception, e:
+        # drop the failing client so the next poll reconnects
+        _clients.pop((client_key, host), None)
+        info = { "state": "down", "pid": None, "uptime": None,
+                 "details": {}, "error": "{}".format(e) }
+    return { host: info }
+
+
+def get_probes(comp):
+    """Return status probes of component as (component, service) tuples; a service
+       of None probes supervisord."""
+
+    return [(comp, i) for i in TPS_SERVICES.get(comp, [])] + [(comp, None)]
+
+
+def probe_status(probe, conf=None, timeout=PROBE_TIMEOUT, host=None):
+    """Run status probe and return its output keyed by host; third-party services
+       are probed directly from the control host if conf is set and their host is
+       reachable, falling back to systemctl if the direct probe fails. If host is
+       set, only that host of the component's role is probed over SSH."""
+
+    comp, service = probe
+    direct_host = None
+    if conf is not None and service in DIRECT_PROBES:
+        direct_host = get_direct_host(conf, comp, service)
+    if direct_host is not None:
+        ret = probe_direct(conf, comp, service, direct_host, timeout)
+        if ret[direct_host]['state'] != 'down': return ret
+        logger.debug("Direct probe of {} on {} failed: {}".format(service, direct_host,
+                     ret[direct_host]['error']))
+    kwargs = { 'roles': [comp] }
+    if host is not None:
+        kwargs['exclude_hosts'] = [h for h in env.roledefs[comp] if h != host]
+    if service is None: ret = execute(fab.supervisor_status, **kwargs)
+    else: ret = execute(fab.systemctl, 'status', service, **kwargs)
+    return { h: None if o is None else "{}".format(o) for h, o in ret.items() }
+
+
+def run_probe(probe, timeout, results, conf=None):
+    """Run status probe in child process and report result."""
+
+    t0 = time.time()
+    try:
+        with settings(hide('everything'), timeout=timeout, command_timeout=timeout):
+            ret = probe_status(probe, conf, timeout)
+        results.put((probe, ret, None, time.time() - t0))
+    except BaseException:
+        results.put((probe, None, traceback.format_exc(), time.time() - t0))
+
+
+def iter_probes(probes, timeout=PROBE_TIMEOUT, conf=None):
+    """Run status probes in parallel and yield (probe, ret, error, latency) in probe
+       order as they finish; probes still running after timeout are killed."""
+
+    results = Queue()
+    procs = {}
+    for probe in probes:
+        p = Process(target=run_probe, args=(probe, timeout, results, conf))
+        p.start()
+        procs[probe] = p
+    deadline = time.time() + timeout
+    finished = {}
+    try:
+        for probe in probes:
+            while probe not in finished:
+                remaining = deadline - time.time()
+                try:
+                    if remaining <= 0: raise Empty()
+                    done, ret, error, latency = results.get(timeout=remaining)
+                except Empty:
+                    finished[probe] = (None, "Timed out after {}s.".format(timeout), timeout)
+                    procs[probe].terminate()
+                    break
+                finished[done] = (ret, error, latency)
+                procs[done].join()
+            yield (probe,) + finished[probe]
+    finally:
+        for p in procs.values():
+            if p.is_alive(): p.terminate()
+            p.join()
+
+
+def print_probe_error(name, error):
+    """Print failed status probe."""
+
+    print("{}: {}".format(name, blink(highlight("UNKNOWN", 'red'))))
+    print(error)
+
+
+def print_supervisor_status(comp, ret):
+    """Print supervisorctl status output of each host of component."""
+
+    for host in sorted(ret):
+        if len(ret) > 1: print(highlight(host, 'cyan'))
+        if ret[host] is None:
+            print(blink(highlight("Supervisord is not running on %s." % comp, 'red')))
+        else: print(ret[host])
+
+
+def print_direct_status(service, ret):
+    """Print status and load details of directly probed service."""
+
+    for host in sorted(ret):
+        info = ret[host]
+        if info['state'] == 'running':
+            print("{}: {}".format(service, highlight(info['state'].upper())))
+        else:
+            print("{}: {}".format(service, blink(highlight(info['state'].upper(), 'red'))))
+            print(info['error'])
+        for k in sorted(info['details']):
+            v = info['details'][k]
+            if isinstance(v, dict):
+                print("  {}:".format(k))
+                for i in sorted(v): print("    {}: {}".format(i, v[i]))
+            else: print("  {}: {}".format(k, v))
+
+
+def print_status(conf, comp, results, debug=False):
+    """"Status of component from probe results."""
+
+    print_component_header(comp)
+    if comp in TPS_SERVICES: print_tps_header(comp)
+    for (c, service), ret, error, latency in results:
+        name = 'supervisord' if service is None else service
+        if service is None: print_supervisor_header(comp)
+        if error is not None: print_probe_error(name, error)
+        elif service is None: print_supervisor_status(comp, ret)
+        elif len(ret) == 0: print_probe_error(name, "No hosts returned status.")
+        elif isinstance(ret.values()[0], dict): print_direct_status(service, ret)
+        else: print_service_status(service, ret, debug)
+
+
+def parse_service_status(stdout):
+    """Return state, PID and uptime of service from systemctl status message."""
+
+    state = pid = uptime = None
+    stdout = stdout or ''
+    match = re.search(r'Active:\s+(\S+)(?:.*?;\s+(.+?)\s+ago)?\s*$', stdout, re.M)
+    if match: state, uptime = match.groups()
+    match = re.search(r'Main PID:\s+(\d+)', stdout)
+    if match: pid = int(match.group(1))
+    return state, pid, uptime
+
+
+def parse_supervisor_status(stdout):
+    """Yield name, state, PID and uptime of each program from supervisorctl status output."""
+
+    for line in stdout.splitlines():
+        match = re.search(r'^(\S+)\s+([A-Z]+)\b\s*(.*)$', line.strip())
+        if not match: continue
+        name, state, info = match.groups()
+        pid = re.search(r'pid\s+(\d+)', info)
+        uptime = re.search(r'uptime\s+(.+)$', info)
+        yield (name, state, int(pid.group(1)) if pid else None,
+               uptime.group(1) if uptime else None)
+
+
+def get_status_records(probe, ret, error, latency, debug=False, host=None):
+    """Return structured status records of probe result, one per host and service;
+       host is recorded on the error record of a failed probe."""
+
+    comp, service = probe
+    base = {
+        "component": comp,
+        "probe": "supervisord" if service is None else "systemd",
+        "details": None,
+        "latency": round(latency, 3),
+        "timestamp": datetime.utcnow().isoformat() + 'Z',
+    }
+    if error is not None:
+        rec = dict(base, host=host, service=service, state="unknown", pid=None,
+                   uptime=None, error=error)
+        return [rec]
+    records = []
+    for host in sorted(ret):
+        stdout = ret[host]
+        if isinstance(stdout, dict):
+            records.append(dict(base, host=host, service=service, probe="direct", **stdout))
+            continue
+        if service is not None:
+            state, pid, uptime = parse_service_status(stdout)
+            if state is None:
+                records.append(dict(base, host=host, service=service, state="unknown",
+                                    pid=None, uptime=None, error=stdout))
+            else:
+                records.append(dict(base, host=host, service=service, state=state,
+                                    pid=pid, uptime=uptime, error=None))
+        elif stdout is None:
+            records.append(dict(base, host=host, service=None, state="not running",
+                                pid=None, uptime=None, error=None))
+        else:
+            for name, state, pid, uptime in parse_supervisor_status(stdout):
+                records.append(dict(base, host=host, service=name, state=state.lower(),
+                                    pid=pid, uptime=uptime, error=None))
+        if debug:
+            for rec in records:
+                if rec['host'] == host: rec['output'] = stdout
+    return records
+
+
+def watch_probe(watch, interval, timeout, results, conf=None):
+    """Poll status probe of a (probe, host) watch every interval seconds in child
+       process, reusing its SSH connection across polls."""
+
+    # leave Ctrl-C to the parent, which terminates this process
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # run in this process so fabric keeps its connection cached; each host of a
+    # role has its own watch process so a slow host doesn't hold up the others
+    probe, host = watch
+    with settings(hide('everything'), parallel=False, timeout=timeout, command_timeout=timeout):
+        while True:
+            t0 = time.time()
+            try:
+                results.put((watch, probe_status(probe, conf, timeout, host), None, time.time() - t0))
+            except BaseException:
+                results.put((watch, None, traceback.format_exc(), time.time() - t0))
+            time.sleep(max(0, interval - (time.time() - t0)))
+
+
+class StatusTable(object):
+    """Terminal status table that redraws only rows that changed."""
+
+    columns = ('component', 'host', 'service', 'state', 'pid', 'uptime')
+    widths = (10, 16, 48, 12, 8, 24)
+
+    def __init__(self, watches, interval, out=sys.stdout):
+        self.watches = watches
+        self.interval = interval
+        self.out = out
+        self.rows = { watch: [] for watch in watches }
+        self.lines = []
+
+    def format_row(self, rec):
+        cells = ["{}".format("" if rec[c] is None else rec[c])[:w - 1].ljust(w)
+                 for c, w in zip(self.columns, self.widths)]
+        line = "".join(cells).rstrip()
+        if rec['error'] is not None or rec['state'] not in ('active', 'running'):
+            return highlight(line, 'red')
+        return line
+
+    def get_lines(self):
+        return [line for watch in self.watches for key, line in self.rows[watch]]
+
+    def footer(self):
+        return "Updated {} | every {}s | Ctrl-C to exit".format(
+               datetime.now().strftime('%H:%M:%S'), self.interval)
+
+    def redraw(self):
+        header = "".join(c.upper().ljust(w) for c, w in zip(self.columns, self.widths)).rstrip()
+        self.lines = self.get_lines()
+        self.out.write("\x1b[2J\x1b[H")
+        self.out.write(highlight(header, 'cyan') + "\n")
+        for line in self.lines: self.out.write(line + "\n")
+        self.out.write(self.footer() + "\n")
+        self.out.flush()
+
+    def update(self, watch, records):
+        old_keys = [k for k, l in self.rows[watch]]
+        self.rows[watch] = [((r['host'], r['service']), self.format_row(r)) for r in records]
+        if old_keys != [k for k, l in self.rows[watch]]:
+            self.redraw()
+            return
+        lines = self.get_lines()
+        for i, line in enumerate(lines):
+            if line != self.lines[i]:
+                # move to row below the header and rewrite it
+                self.out.write("\x1b[{};1H\x1b[2K{}".format(i + 2, line))
+        self.lines = lines
+        self.out.write("\x1b[{};1H\x1b[2K{}\n".format(len(lines) + 2, self.footer()))
+        self.out.flush()
+
+
+def get_error_class(error):
+    """Return stable class of probe error, e.g. the exception type of a traceback,
+       so watch mode only reports changes of error."""
+
+    if error is None: return None
+    lines = error.strip().splitlines()
+    return lines[-1].split(':', 1)[0] if len(lines) > 0 else ''
+
+
+def get_watches(probes, conf=None):
+    """Return (probe, host) watches of probes, one per host of the component's
+       role; directly probed services and unknown roles are watched as a whole."""
+
+    fab.setup_env()
+    watches = []
+    for probe in probes:
+        comp, service = probe
+        direct = conf is not None and service in DIRECT_PROBES and \
+                 get_direct_host(conf, comp, service) is not None
+        hosts = env.roledefs.get(comp, [])
+        if direct or len(hosts) < 2: watches.append((probe, None))
+        else: watches.extend((probe, h) for h in hosts)
+    return watches
+
+
+def watch_status(probes, interval, timeout=PROBE_TIMEOUT, fmt='text', debug=False, conf=None):
+    """Poll probes every interval seconds until interrupted, rendering only changes."""
+
+    watches = get_watches(probes, conf)
+    results = Queue()
+    procs = []
+    for watch in watches:
+        p = Process(target=watch_probe, args=(watch, interval, timeout, results, conf))
+        p.daemon = True
+        p.start()
+        procs.append(p)
+    table = StatusTable(watches, interval)
+    if fmt == 'text': table.redraw()
+    last_seen = { watch: time.time() for watch in watches }
+    last_states = {}
+
+    def render(watch, ret, error, latency, silent=None):
+        probe, host = watch
+        records = get_status_records(probe, ret, error, latency, debug, host)
+        for rec in records: rec['silent'] = None if silent is None else int(silent)
+        if fmt != 'ndjson': return table.update(watch, records)
+        for rec in records:
+            key = (rec['component'], rec['probe'], rec['host'], rec['service'])
+            state = (rec['state'], rec['pid'], get_error_class(rec['error']))
+            if last_states.get(key) == state: continue
+            last_states[key] = state
+            print(json.dumps(rec, sort_keys=True))
+        sys.stdout.flush()
+
+    try:
+        while True:
+            try: watch, ret, error, latency = results.get(timeout=1)
+            except Empty:
+                # report probes that stopped responding; silent holds the seconds
+                # since their last result so the error stays the same across ticks
+                now = time.time()
+                for watch in watches:
+                    silent = now - last_seen[watch]
+                    if silent > interval + timeout:
+                        render(watch, None, "No response.", silent, silent)
+                continue
+            last_seen[watch] = time.time()
+            render(watch, ret, error, latency)
+    except KeyboardInterrupt: pass
+    finally:
+        for p in procs:
+            if p.is_alive(): p.terminate()
+            p.join()
+
+
+def status_comp(comp, conf, debug=False, timeout=PROBE_TIMEOUT, fmt='text', watch=None,
+                direct=False):
+    """Status of component(s), probing all components and services in parallel."""
+
+    comps = [i for i in STATUS_COMPS if comp in ('all', i)]
+    probes = [p for c in comps for p in get_probes(c)]
+    probe_conf = conf if direct else None
+    if watch is not None:
+        return watch_status(probes, watch, timeout, fmt, debug, probe_conf)
+    t0 = time.time()
+    results = []
+    records = []
+    for probe, ret, error, latency in iter_probes(probes, timeout, probe_conf):
+        if fmt == 'ndjson':
+            for rec in get_status_records(probe, ret, error, latency, debug):
+                print(json.dumps(rec, sort_keys=True))
+            sys.stdout.flush()
+        elif fmt == 'json':
+            records.extend(get_status_records(probe, ret, error, latency, debug))
+        else:
+            results.append((probe, ret, error, latency))
+            if probe[1] is None:
+                print_status(conf, probe[0], results, debug)
+                results = []
+    if fmt == 'json':
+        print(json.dumps({
+            "timestamp": datetime.utcnow().isoformat() + 'Z',
+            "elapsed": round(time.time() - t0, 3),
+            "results": records,
+        }, indent=2, sort_keys=True, separators=(",", ": ")))
+
+
+def status(comp, debug=False, timeout=PROBE_TIMEOUT, fmt='text', watch=None, direct=False):
     """Component status."""
 
     # get user's SDS conf settings
@@ -166,4 +573,7 @@ def status(comp, debug=False):
 
     logger.debug("Status for %s component(s)" % comp)
 
-    status_comp(comp, conf, debug)
+    if watch is not None and fmt == 'json':
+        logger.error("--watch can't be used with --json; use --ndjson instead.")
+        return 1
+    status_comp(comp, conf, debug, timeout, fmt, watch, direct)
@@ -6,7 +6,10 @@ from __future__ import absolute_import
 from __future__ import print_function
 
 import os, yaml, pwd, hashlib, traceback
-from fabric.api import execute, hide
+from collections import OrderedDict
+from multiprocessing import Process, Queue
+from Queue import Empty
+from fabric.api import hide
 from tqdm import tqdm
 
 from prompt_toolkit.shortcuts import prompt, print_tokens
@@ -17,9 +20,10 @@ from pygments.token import Token
 from sdscli.log_utils import logger
 from sdscli.conf_utils import get_user_files_path, SettingsConf
 from sdscli.os_utils import validate_dir
-from sdscli.prompt_utils import YesNoValidator, set_bar_desc
+from sdscli.prompt_utils import YesNoValidator, set_bar_desc, highlight, blink
 
 from . import fabfile as fab
+from .fabfile import execute
 
 
 prompt_style = style_from_dict({
@@ -29,11 +33,85 @@ prompt_style = style_from_dict({
 })
 
 
-def update_mozart(conf, ndeps=False, comp='mozart'):
+class RemoteBatch(object):
+    """Collect remote file operations and run them on a role's hosts in one
+       round trip when the batch is flushed or the with block exits."""
+
+    def __init__(self, role):
+        self.role = role
+        self.cmds = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None: self.flush()
+
+    def rm_rf(self, path):
+        self.cmds.append('rm -rf %s' % path)
+
+    def chmod(self, perms, path):
+        self.cmds.append('chmod -R %s %s' % (perms, path))
+
+    def mkdir(self, d, o=None, g=None):
+        self.cmds.append('mkdir -p %s' % d)
+
+    def cp_rp(self, src, dest):
+        self.cmds.append('cp -rp %s %s' % (src, dest))
+
+    def cp_rp_exists(self, src, dest):
+        self.cmds.append('if [ -e %s ]; then cp -rp %s %s; fi' % (src, src, dest))
+
+    def ln_sf(self, src, dest):
+        self.cmds.append('rm -rf %s' % dest)
+        self.cmds.append('(cd %s && ln -sf %s %s)' % (os.path.dirname(dest), src, os.path.basename(dest)))
+
+    def flush(self):
+        if len(self.cmds) == 0: return
+        logger.debug("Running {} batched commands on {}.".format(len(self.cmds), self.role))
+        execute(fab.run_batch, self.cmds, roles=[self.role])
+        self.cmds = []
+
+
+class TemplateBatch(object):
+    """Collect templates and send them to a role's hosts in one transfer when the
+       batch is flushed or the with block exits; files already up to date are skipped."""
+
+    def __init__(self, role):
+        self.role = role
+        self.templates = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None: self.flush()
+
+    def send_template(self, tmpl, dest, tmpl_dir=None, node_type=None):
+        if tmpl_dir is None: tmpl_dir = get_user_files_path()
+        self.templates.append((tmpl, dest, os.path.expanduser(tmpl_dir), node_type))
+
+    def send_template_user_override(self, tmpl, dest, tmpl_dir=None, node_type=None):
+        if tmpl_dir is None: tmpl_dir = get_user_files_path()
+        tmpl_dir = fab.resolve_files_dir(tmpl, os.path.expanduser(tmpl_dir))
+        self.templates.append((tmpl, dest, tmpl_dir, node_type))
+
+    def flush(self):
+        if len(self.templates) == 0: return
+        logger.debug("Sending {} batched templates to {}.".format(len(self.templates), self.role))
+
+        # compile before forking so parallel host tasks reuse the compiled templates
+        fab.compile_templates(self.templates)
+        execute(fab.send_templates, self.templates, roles=[self.role])
+        self.templates = []
+
+
+def update_mozart(conf, ndeps=False, comp='mozart', position=None, incremental=False,
+                  wheelhouse=False):
     """"Update mozart component."""
 
     # progress bar
-    with tqdm(total=24) as bar:
+    with tqdm(total=24, position=position) as bar:
 
         # ensure venv
         set_bar_desc(bar, 'Ensuring HySDS venv')
@@ -47,57 +125,49 @@ def update_mozart(conf, ndeps=False, comp='mozart'):
 
         # update reqs
         set_bar_desc(bar, 'Updating HySDS core')
-        execute(fab.pip_install_with_req, 'mozart', '~/mozart/ops/osaka', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'mozart', '~/mozart/ops/prov_es', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'mozart', '~/mozart/ops/hysds_commons', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'mozart', '~/mozart/ops/hysds/third_party/celery-v3.1.25.pqueue', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'mozart', '~/mozart/ops/hysds', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'mozart', '~/mozart/ops/sciflo', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'mozart', '~/mozart/ops/mozart', ndeps, roles=[comp])
+        if wheelhouse: execute(fab.rsync_wheelhouse, 'mozart', roles=[comp])
+        execute(fab.pip_install_pkgs, 'mozart', [
+                    '~/mozart/ops/osaka',
+                    '~/mozart/ops/prov_es',
+                    '~/mozart/ops/hysds_commons',
+                    '~/mozart/ops/hysds/third_party/celery-v3.1.25.pqueue',
+                    '~/mozart/ops/hysds',
+                    '~/mozart/ops/sciflo',
+                    '~/mozart/ops/mozart',
+                ], ndeps, wheelhouse, roles=[comp])
+        bar.update(7)
+
+        # remove stale configs and refresh job_creators in one round trip
+        set_bar_desc(bar, 'Removing stale configs')
+        with RemoteBatch(comp) as batch:
+            batch.rm_rf('~/mozart/ops/hysds/celeryconfig.pyc')
+            batch.rm_rf('~/mozart/etc/orchestrator_*.json')
+            batch.rm_rf('~/mozart/etc/job_creators')
+            batch.cp_rp('~/mozart/ops/hysds/scripts/job_creators', '~/mozart/etc/')
+            batch.rm_rf('~/mozart/ops/mozart/actions_config.json')
         bar.update()
 
         # update celery config
         set_bar_desc(bar, 'Updating celery config')
-        execute(fab.rm_rf, '~/mozart/ops/hysds/celeryconfig.py', roles=[comp])
-        execute(fab.rm_rf, '~/mozart/ops/hysds/celeryconfig.pyc', roles=[comp])
         execute(fab.send_celeryconf, 'mozart', roles=[comp])
         bar.update()
 
-        # update supervisor config
-        set_bar_desc(bar, 'Updating supervisor config')
-        execute(fab.rm_rf, '~/mozart/etc/supervisord.conf', roles=[comp])
-        execute(fab.send_template_user_override, 'supervisord.conf.mozart', 
-                '~/mozart/etc/supervisord.conf', '~/mozart/ops/hysds/configs/supervisor',
-                roles=[comp])
-        bar.update()
+        # update supervisor and datasets configs; overwrite datasets config with domain-specific config
+        set_bar_desc(bar, 'Updating supervisor and datasets configs')
+        with TemplateBatch(comp) as batch:
+            batch.send_template_user_override('supervisord.conf.mozart', '~/mozart/etc/supervisord.conf',
+                                              '~/mozart/ops/hysds/configs/supervisor')
+            batch.send_template('datasets.json', '~/mozart/etc/datasets.json')
+        bar.update(2)
 
         # update orchestrator config
         set_bar_desc(bar, 'Updating orchestrator config')
-        execute(fab.rm_rf, '~/mozart/etc/orchestrator_*.json', roles=[comp])
         execute(fab.copy, '~/mozart/ops/hysds/configs/orchestrator/orchestrator_jobs.json',
                 '~/mozart/etc/orchestrator_jobs.json', roles=[comp])
         execute(fab.copy, '~/mozart/ops/hysds/configs/orchestrator/orchestrator_datasets.json',
                 '~/mozart/etc/orchestrator_datasets.json', roles=[comp])
         bar.update()
 
-        # update job_creators
-        set_bar_desc(bar, 'Updating job_creators')
-        execute(fab.rm_rf, '~/mozart/etc/job_creators', roles=[comp])
-        execute(fab.cp_rp, '~/mozart/ops/hysds/scripts/job_creators', '~/mozart/etc/', roles=[comp])
-        bar.update()
-
-        #update datasets config; overwrite datasets config with domain-specific config
-        set_bar_desc(bar, 'Updating datasets config')
-        execute(fab.rm_rf, '~/mozart/etc/datasets.json', roles=[comp])
-        execute(fab.send_template, 'datasets.json', '~/mozart/etc/datasets.json', roles=[comp])
-        bar.update()
-
         # ship logstash shipper configs
         set_bar_desc(bar, 'Updating logstash shipper config')
         execute(fab.send_shipper_conf, 'mozart', '/home/hysdsops/mozart/log', conf.get('MOZART_ES_CLUSTER'),
@@ -106,16 +176,13 @@ def update_mozart(conf, ndeps=False, comp='mozart'):
 
         # update mozart config
         set_bar_desc(bar, 'Updating mozart config')
-        execute(fab.rm_rf, '~/mozart/ops/mozart/settings.cfg', roles=[comp])
         execute(fab.send_mozartconf, roles=[comp])
-        execute(fab.rm_rf, '~/mozart/ops/mozart/actions_config.json', roles=[comp])
         execute(fab.copy, '~/mozart/ops/mozart/configs/actions_config.json.example', 
                 '~/mozart/ops/mozart/actions_config.json', roles=[comp])
         bar.update()
 
         # update figaro config
         set_bar_desc(bar, 'Updating figaro config')
-        execute(fab.rm_rf, '~/mozart/ops/figaro/settings.cfg', roles=[comp])
         execute(fab.send_figaroconf, roles=[comp])
         bar.update()
 
@@ -129,23 +196,21 @@ def update_mozart(conf, ndeps=False, comp='mozart'):
         execute(fab.ensure_ssl, 'mozart', roles=[comp])
         bar.update()
 
-        # link ssl certs to apps
-        execute(fab.ln_sf, '~/ssl/server.key', '~/mozart/ops/mozart/server.key', roles=[comp])
-        execute(fab.ln_sf, '~/ssl/server.pem', '~/mozart/ops/mozart/server.pem', roles=[comp])
-        bar.update()
-
-        # expose hysds log dir via webdav
-        set_bar_desc(bar, 'Expose logs')
-        execute(fab.mkdir, '/data/work', None, None, roles=[comp])
-        execute(fab.ln_sf, '~/mozart/log', '/data/work/log', roles=[comp])
-        bar.update()
-
         # ship netrc
         set_bar_desc(bar, 'Configuring netrc')
         execute(fab.send_template, 'netrc.mozart', '.netrc', node_type='mozart', roles=[comp])
-        execute(fab.chmod, 600, '.netrc', roles=[comp])
         bar.update()
 
+        # link ssl certs to apps, expose hysds log dir via webdav and secure netrc
+        set_bar_desc(bar, 'Linking certs and logs')
+        with RemoteBatch(comp) as batch:
+            batch.ln_sf('~/ssl/server.key', '~/mozart/ops/mozart/server.key')
+            batch.ln_sf('~/ssl/server.pem', '~/mozart/ops/mozart/server.pem')
+            batch.mkdir('/data/work')
+            batch.ln_sf('~/mozart/log', '/data/work/log')
+            batch.chmod(600, '.netrc')
+        bar.update(2)
+
         # update ES template
         set_bar_desc(bar, 'Update ES template')
         execute(fab.install_pkg_es_templates, roles=[comp])
@@ -158,11 +223,12 @@ def update_mozart(conf, ndeps=False, comp='mozart'):
         set_bar_desc(bar, 'Updated mozart')
 
 
-def update_metrics(conf, ndeps=False, comp='metrics'):
+def update_metrics(conf, ndeps=False, comp='metrics', position=None, incremental=False,
+                   wheelhouse=False):
     """"Update metrics component."""
 
     # progress bar
-    with tqdm(total=20) as bar:
+    with tqdm(total=17, position=position) as bar:
 
         # ensure venv
         set_bar_desc(bar, 'Ensuring HySDS venv')
@@ -176,49 +242,41 @@ def update_metrics(conf, ndeps=False, comp='metrics'):
 
         # update
         set_bar_desc(bar, 'Syncing packages')
-        execute(fab.rm_rf, '~/metrics/ops/*', roles=[comp])
-        execute(fab.rsync_code, 'metrics', roles=[comp])
+        if not incremental: execute(fab.rm_rf, '~/metrics/ops/*', roles=[comp])
+        execute(fab.rsync_code, 'metrics', incremental=incremental, roles=[comp])
         bar.update()
 
         # update reqs
         set_bar_desc(bar, 'Updating HySDS core')
-        execute(fab.pip_install_with_req, 'metrics', '~/metrics/ops/osaka', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'metrics', '~/metrics/ops/prov_es', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'metrics', '~/metrics/ops/hysds_commons', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'metrics', '~/metrics/ops/hysds/third_party/celery-v3.1.25.pqueue', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'metrics', '~/metrics/ops/hysds', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'metrics', '~/metrics/ops/sciflo', ndeps, roles=[comp])
+        if wheelhouse: execute(fab.rsync_wheelhouse, 'metrics', roles=[comp])
+        execute(fab.pip_install_pkgs, 'metrics', [
+                    '~/metrics/ops/osaka',
+                    '~/metrics/ops/prov_es',
+                    '~/metrics/ops/hysds_commons',
+                    '~/metrics/ops/hysds/third_party/celery-v3.1.25.pqueue',
+                    '~/metrics/ops/hysds',
+                    '~/metrics/ops/sciflo',
+                ], ndeps, wheelhouse, roles=[comp])
+        bar.update(6)
+
+        # remove stale configs in one round trip
+        set_bar_desc(bar, 'Removing stale configs')
+        with RemoteBatch(comp) as batch:
+            batch.rm_rf('~/metrics/ops/hysds/celeryconfig.pyc')
         bar.update()
 
         # update celery config
         set_bar_desc(bar, 'Updating celery config')
-        execute(fab.rm_rf, '~/metrics/ops/hysds/celeryconfig.py', roles=[comp])
-        bar.update()
-        execute(fab.rm_rf, '~/metrics/ops/hysds/celeryconfig.pyc', roles=[comp])
-        bar.update()
         execute(fab.send_celeryconf, 'metrics', roles=[comp])
         bar.update()
 
-        # update supervisor config
-        set_bar_desc(bar, 'Updating supervisor config')
-        execute(fab.rm_rf, '~/metrics/etc/supervisord.conf', roles=[comp])
-        bar.update()
-        execute(fab.send_template_user_override, 'supervisord.conf.metrics',
-                '~/metrics/etc/supervisord.conf', '~/mozart/ops/hysds/configs/supervisor',
-                roles=[comp])
-        bar.update()
-
-        #update datasets config; overwrite datasets config with domain-specific config
-        set_bar_desc(bar, 'Updating datasets config')
-        execute(fab.rm_rf, '~/metrics/etc/datasets.json', roles=[comp])
-        bar.update()
-        execute(fab.send_template, 'datasets.json', '~/metrics/etc/datasets.json', roles=[comp])
-        bar.update()
+        # update supervisor and datasets configs; overwrite datasets config with domain-specific config
+        set_bar_desc(bar, 'Updating supervisor and datasets configs')
+        with TemplateBatch(comp) as batch:
+            batch.send_template_user_override('supervisord.conf.metrics', '~/metrics/etc/supervisord.conf',
+                                              '~/mozart/ops/hysds/configs/supervisor')
+            batch.send_template('datasets.json', '~/metrics/etc/datasets.json')
+        bar.update(2)
 
         # ship logstash shipper configs
         set_bar_desc(bar, 'Updating logstash shipper config')
@@ -233,8 +291,9 @@ def update_metrics(conf, ndeps=False, comp='metrics'):
 
         # expose hysds log dir via webdav
         set_bar_desc(bar, 'Expose logs')
-        execute(fab.mkdir, '/data/work', None, None, roles=[comp])
-        execute(fab.ln_sf, '~/metrics/log', '/data/work/log', roles=[comp])
+        with RemoteBatch(comp) as batch:
+            batch.mkdir('/data/work')
+            batch.ln_sf('~/metrics/log', '/data/work/log')
         bar.update()
 
         # ship AWS creds
@@ -244,11 +303,12 @@ def update_metrics(conf, ndeps=False, comp='metrics'):
         set_bar_desc(bar, 'Updated metrics')
 
 
-def update_grq(conf, ndeps=False, comp='grq'):
+def update_grq(conf, ndeps=False, comp='grq', position=None, incremental=False,
+               wheelhouse=False):
     """"Update grq component."""
 
     # progress bar
-    with tqdm(total=21) as bar:
+    with tqdm(total=22, position=position) as bar:
 
         # ensure venv
         set_bar_desc(bar, 'Ensuring HySDS venv')
@@ -262,46 +322,44 @@ def update_grq(conf, ndeps=False, comp='grq'):
 
         # update
         set_bar_desc(bar, 'Syncing packages')
-        execute(fab.rm_rf, '~/sciflo/ops/*', roles=[comp])
-        execute(fab.rsync_code, 'grq', 'sciflo', roles=[comp])
+        if not incremental: execute(fab.rm_rf, '~/sciflo/ops/*', roles=[comp])
+        execute(fab.rsync_code, 'grq', 'sciflo', incremental=incremental, roles=[comp])
         execute(fab.pip_upgrade, 'gunicorn', 'sciflo', roles=[comp]) # ensure latest gunicorn
         bar.update()
 
         # update reqs
         set_bar_desc(bar, 'Updating HySDS core')
-        execute(fab.pip_install_with_req, 'sciflo', '~/sciflo/ops/osaka', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'sciflo', '~/sciflo/ops/prov_es', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'sciflo', '~/sciflo/ops/hysds_commons', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'sciflo', '~/sciflo/ops/hysds/third_party/celery-v3.1.25.pqueue', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'sciflo', '~/sciflo/ops/hysds', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'sciflo', '~/sciflo/ops/sciflo', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'sciflo', '~/sciflo/ops/grq2', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'sciflo', '~/sciflo/ops/tosca', ndeps, roles=[comp])
+        if wheelhouse: execute(fab.rsync_wheelhouse, 'sciflo', roles=[comp])
+        execute(fab.pip_install_pkgs, 'sciflo', [
+                    '~/sciflo/ops/osaka',
+                    '~/sciflo/ops/prov_es',
+                    '~/sciflo/ops/hysds_commons',
+                    '~/sciflo/ops/hysds/third_party/celery-v3.1.25.pqueue',
+                    '~/sciflo/ops/hysds',
+                    '~/sciflo/ops/sciflo',
+                    '~/sciflo/ops/grq2',
+                    '~/sciflo/ops/tosca',
+                ], ndeps, wheelhouse, roles=[comp])
+        bar.update(8)
+
+        # remove stale configs in one round trip
+        set_bar_desc(bar, 'Removing stale configs')
+        with RemoteBatch(comp) as batch:
+            batch.rm_rf('~/sciflo/ops/hysds/celeryconfig.pyc')
         bar.update()
 
         # update celery config
         set_bar_desc(bar, 'Updating celery config')
-        execute(fab.rm_rf, '~/sciflo/ops/hysds/celeryconfig.py', roles=[comp])
-        execute(fab.rm_rf, '~/sciflo/ops/hysds/celeryconfig.pyc', roles=[comp])
         execute(fab.send_celeryconf, 'grq', roles=[comp])
         bar.update()
 
         # update grq2 config
         set_bar_desc(bar, 'Updating grq2 config')
-        execute(fab.rm_rf, '~/sciflo/ops/grq2/settings.cfg', roles=[comp])
         execute(fab.send_grq2conf, roles=[comp])
         bar.update()
 
         # update tosca config and facetview.html
         set_bar_desc(bar, 'Updating tosca config and facetview.html')
-        execute(fab.rm_rf, '~/sciflo/ops/tosca/settings.cfg', roles=[comp])
         execute(fab.send_toscaconf, 'tosca_settings.cfg.tmpl', roles=[comp])
         tosca_fv = os.path.join(get_user_files_path(), 'tosca_facetview.html')
         if os.path.exists(tosca_fv):
@@ -309,37 +367,29 @@ def update_grq(conf, ndeps=False, comp='grq'):
             execute(fab.chmod, 644, '~/sciflo/ops/tosca/tosca/templates/facetview.html', roles=[comp])
         bar.update()
 
-        # update supervisor config
-        set_bar_desc(bar, 'Updating supervisor config')
-        execute(fab.rm_rf, '~/sciflo/etc/supervisord.conf', roles=[comp])
-        execute(fab.send_template_user_override, 'supervisord.conf.grq',
-                '~/sciflo/etc/supervisord.conf', '~/mozart/ops/hysds/configs/supervisor',
-                roles=[comp])
-        bar.update()
-
-        #update datasets config; overwrite datasets config with domain-specific config
-        set_bar_desc(bar, 'Updating datasets config')
-        execute(fab.rm_rf, '~/sciflo/etc/datasets.json', roles=[comp])
-        execute(fab.send_template, 'datasets.json', '~/sciflo/etc/datasets.json', roles=[comp])
-        bar.update()
+        # update supervisor and datasets configs; overwrite datasets config with domain-specific config
+        set_bar_desc(bar, 'Updating supervisor and datasets configs')
+        with TemplateBatch(comp) as batch:
+            batch.send_template_user_override('supervisord.conf.grq', '~/sciflo/etc/supervisord.conf',
+                                              '~/mozart/ops/hysds/configs/supervisor')
+            batch.send_template('datasets.json', '~/sciflo/etc/datasets.json')
+        bar.update(2)
 
         # ensure self-signed SSL certs exist
         set_bar_desc(bar, 'Configuring SSL')
         execute(fab.ensure_ssl, 'grq', roles=[comp])
         bar.update()
 
-        # link ssl certs to apps
-        execute(fab.ln_sf, '~/ssl/server.key', '~/sciflo/ops/grq2/server.key', roles=[comp])
-        execute(fab.ln_sf, '~/ssl/server.pem', '~/sciflo/ops/grq2/server.pem', roles=[comp])
-        execute(fab.ln_sf, '~/ssl/server.key', '~/sciflo/ops/tosca/server.key', roles=[comp])
-        execute(fab.ln_sf, '~/ssl/server.pem', '~/sciflo/ops/tosca/server.pem', roles=[comp])
-        bar.update()
-
-        # expose hysds log dir via webdav
-        set_bar_desc(bar, 'Expose logs')
-        execute(fab.mkdir, '/data/work', None, None, roles=[comp])
-        execute(fab.ln_sf, '~/sciflo/log', '/data/work/log', roles=[comp])
-        bar.update()
+        # link ssl certs to apps and expose hysds log dir via webdav
+        set_bar_desc(bar, 'Linking certs and logs')
+        with RemoteBatch(comp) as batch:
+            batch.ln_sf('~/ssl/server.key', '~/sciflo/ops/grq2/server.key')
+            batch.ln_sf('~/ssl/server.pem', '~/sciflo/ops/grq2/server.pem')
+            batch.ln_sf('~/ssl/server.key', '~/sciflo/ops/tosca/server.key')
+            batch.ln_sf('~/ssl/server.pem', '~/sciflo/ops/tosca/server.pem')
+            batch.mkdir('/data/work')
+            batch.ln_sf('~/sciflo/log', '/data/work/log')
+        bar.update(2)
 
         # update ES template
         set_bar_desc(bar, 'Update ES template')
@@ -354,11 +404,12 @@ def update_grq(conf, ndeps=False, comp='grq'):
         set_bar_desc(bar, 'Updated grq')
 
 
-def update_factotum(conf, ndeps=False, comp='factotum'):
+def update_factotum(conf, ndeps=False, comp='factotum', position=None, incremental=False,
+                    wheelhouse=False):
     """"Update factotum component."""
 
     # progress bar
-    with tqdm(total=14) as bar:
+    with tqdm(total=15, position=position) as bar:
 
         # ensure venv
         set_bar_desc(bar, 'Ensuring HySDS venv')
@@ -373,59 +424,56 @@ def update_factotum(conf, ndeps=False, comp='factotum'):
 
         # update
         set_bar_desc(bar, 'Syncing packages')
-        execute(fab.rm_rf, '~/verdi/ops/*', roles=[comp])
-        execute(fab.rsync_code, 'factotum', 'verdi', roles=[comp])
+        if not incremental: execute(fab.rm_rf, '~/verdi/ops/*', roles=[comp])
+        execute(fab.rsync_code, 'factotum', 'verdi', incremental=incremental, roles=[comp])
         execute(fab.set_spyddder_settings, roles=[comp])
         bar.update()
 
         # update reqs
         set_bar_desc(bar, 'Updating HySDS core')
-        execute(fab.pip_install_with_req, 'verdi', '~/verdi/ops/osaka', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'verdi', '~/verdi/ops/prov_es', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'verdi', '~/verdi/ops/hysds_commons', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'verdi', '~/verdi/ops/hysds/third_party/celery-v3.1.25.pqueue', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'verdi', '~/verdi/ops/hysds', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'verdi', '~/verdi/ops/sciflo', ndeps, roles=[comp])
+        if wheelhouse: execute(fab.rsync_wheelhouse, 'verdi', roles=[comp])
+        execute(fab.pip_install_pkgs, 'verdi', [
+                    '~/verdi/ops/osaka',
+                    '~/verdi/ops/prov_es',
+                    '~/verdi/ops/hysds_commons',
+                    '~/verdi/ops/hysds/third_party/celery-v3.1.25.pqueue',
+                    '~/verdi/ops/hysds',
+                    '~/verdi/ops/sciflo',
+                ], ndeps, wheelhouse, roles=[comp])
+        bar.update(6)
+
+        # remove stale configs in one round trip
+        set_bar_desc(bar, 'Removing stale configs')
+        with RemoteBatch(comp) as batch:
+            batch.rm_rf('~/verdi/ops/hysds/celeryconfig.pyc')
         bar.update()
 
         # update celery config
         set_bar_desc(bar, 'Updating celery config')
-        execute(fab.rm_rf, '~/verdi/ops/hysds/celeryconfig.py', roles=[comp])
-        execute(fab.rm_rf, '~/verdi/ops/hysds/celeryconfig.pyc', roles=[comp])
         execute(fab.send_celeryconf, 'verdi', roles=[comp])
         bar.update()
 
-        # update supervisor config
-        set_bar_desc(bar, 'Updating supervisor config')
-        execute(fab.rm_rf, '~/verdi/etc/supervisord.conf', roles=[comp])
-        execute(fab.send_template_user_override, 'supervisord.conf.factotum', 
-                '~/verdi/etc/supervisord.conf', '~/mozart/ops/hysds/configs/supervisor',
-                roles=[comp])
-        bar.update()
-
-        #update datasets config; overwrite datasets config with domain-specific config
-        set_bar_desc(bar, 'Updating datasets config')
-        execute(fab.rm_rf, '~/verdi/etc/datasets.json', roles=[comp])
-        execute(fab.send_template, 'datasets.json', '~/verdi/etc/datasets.json', roles=[comp])
-        bar.update()
-
-        # expose hysds log dir via webdav
-        set_bar_desc(bar, 'Expose logs')
-        execute(fab.mkdir, '/data/work', None, None, roles=[comp])
-        execute(fab.ln_sf, '~/verdi/log', '/data/work/log', roles=[comp])
-        bar.update()
+        # update supervisor and datasets configs; overwrite datasets config with domain-specific config
+        set_bar_desc(bar, 'Updating supervisor and datasets configs')
+        with TemplateBatch(comp) as batch:
+            batch.send_template_user_override('supervisord.conf.factotum', '~/verdi/etc/supervisord.conf',
+                                              '~/mozart/ops/hysds/configs/supervisor')
+            batch.send_template('datasets.json', '~/verdi/etc/datasets.json')
+        bar.update(2)
 
         # ship netrc
         netrc = os.path.join(get_user_files_path(), 'netrc')
         if os.path.exists(netrc):
             set_bar_desc(bar, 'Configuring netrc')
             execute(fab.copy, netrc, '.netrc', roles=[comp])
-            execute(fab.chmod, 600, '.netrc', roles=[comp])
+
+        # expose hysds log dir via webdav and secure netrc
+        set_bar_desc(bar, 'Expose logs')
+        with RemoteBatch(comp) as batch:
+            batch.mkdir('/data/work')
+            batch.ln_sf('~/verdi/log', '/data/work/log')
+            if os.path.exists(netrc): batch.chmod(600, '.netrc')
+        bar.update()
 
         # ship AWS creds
         set_bar_desc(bar, 'Configuring AWS creds')
@@ -434,11 +482,12 @@ def update_factotum(conf, ndeps=False, comp='factotum'):
         set_bar_desc(bar, 'Updated factotum')
 
 
-def update_verdi(conf, ndeps=False, comp='verdi'):
+def update_verdi(conf, ndeps=False, comp='verdi', position=None, incremental=False,
+                 wheelhouse=False):
     """"Update verdi component."""
 
     # progress bar
-    with tqdm(total=15) as bar:
+    with tqdm(total=16, position=position) as bar:
 
         # ensure venv
         set_bar_desc(bar, 'Ensuring HySDS venv')
@@ -453,65 +502,63 @@ def update_verdi(conf, ndeps=False, comp='verdi'):
 
         # remove code bundle stuff
         set_bar_desc(bar, 'Remove code bundle')
-        execute(fab.rm_rf, '~/verdi/ops/etc', roles=[comp])
-        execute(fab.rm_rf, '~/verdi/ops/install.sh', roles=[comp])
+        with RemoteBatch(comp) as batch:
+            batch.rm_rf('~/verdi/ops/etc')
+            batch.rm_rf('~/verdi/ops/install.sh')
+            if not incremental: batch.rm_rf('~/verdi/ops/*')
         bar.update()
 
         # update
         set_bar_desc(bar, 'Syncing packages')
-        execute(fab.rm_rf, '~/verdi/ops/*', roles=[comp])
-        execute(fab.rsync_code, 'verdi', roles=[comp])
+        execute(fab.rsync_code, 'verdi', incremental=incremental, roles=[comp])
         execute(fab.set_spyddder_settings, roles=[comp])
         bar.update()
 
         # update reqs
         set_bar_desc(bar, 'Updating HySDS core')
-        execute(fab.pip_install_with_req, 'verdi', '~/verdi/ops/osaka', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'verdi', '~/verdi/ops/prov_es', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'verdi', '~/verdi/ops/hysds_commons', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'verdi', '~/verdi/ops/hysds/third_party/celery-v3.1.25.pqueue', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'verdi', '~/verdi/ops/hysds', ndeps, roles=[comp])
-        bar.update()
-        execute(fab.pip_install_with_req, 'verdi', '~/verdi/ops/sciflo', ndeps, roles=[comp])
+        if wheelhouse: execute(fab.rsync_wheelhouse, 'verdi', roles=[comp])
+        execute(fab.pip_install_pkgs, 'verdi', [
+                    '~/verdi/ops/osaka',
+                    '~/verdi/ops/prov_es',
+                    '~/verdi/ops/hysds_commons',
+                    '~/verdi/ops/hysds/third_party/celery-v3.1.25.pqueue',
+                    '~/verdi/ops/hysds',
+                    '~/verdi/ops/sciflo',
+                ], ndeps, wheelhouse, roles=[comp])
+        bar.update(6)
+
+        # remove stale configs in one round trip
+        set_bar_desc(bar, 'Removing stale configs')
+        with RemoteBatch(comp) as batch:
+            batch.rm_rf('~/verdi/ops/hysds/celeryconfig.pyc')
         bar.update()
 
         # update celery config
         set_bar_desc(bar, 'Updating celery config')
-        execute(fab.rm_rf, '~/verdi/ops/hysds/celeryconfig.py', roles=[comp])
-        execute(fab.rm_rf, '~/verdi/ops/hysds/celeryconfig.pyc', roles=[comp])
         execute(fab.send_celeryconf, 'verdi', roles=[comp])
         bar.update()
 
-        # update supervisor config
-        set_bar_desc(bar, 'Updating supervisor config')
-        execute(fab.rm_rf, '~/verdi/etc/supervisord.conf', roles=[comp])
-        execute(fab.send_template_user_override, 'supervisord.conf.verdi', 
-                '~/verdi/etc/supervisord.conf', '~/mozart/ops/hysds/configs/supervisor',
-                roles=[comp])
-        bar.update()
-
-        #update datasets config; overwrite datasets config with domain-specific config
-        set_bar_desc(bar, 'Updating datasets config')
-        execute(fab.rm_rf, '~/verdi/etc/datasets.json', roles=[comp])
-        execute(fab.send_template, 'datasets.json', '~/verdi/etc/datasets.json', roles=[comp])
-        bar.update()
-
-        # expose hysds log dir via webdav
-        set_bar_desc(bar, 'Expose logs')
-        execute(fab.mkdir, '/data/work', None, None, roles=[comp])
-        execute(fab.ln_sf, '~/verdi/log', '/data/work/log', roles=[comp])
-        bar.update()
+        # update supervisor and datasets configs; overwrite datasets config with domain-specific config
+        set_bar_desc(bar, 'Updating supervisor and datasets configs')
+        with TemplateBatch(comp) as batch:
+            batch.send_template_user_override('supervisord.conf.verdi', '~/verdi/etc/supervisord.conf',
+                                              '~/mozart/ops/hysds/configs/supervisor')
+            batch.send_template('datasets.json', '~/verdi/etc/datasets.json')
+        bar.update(2)
 
         # ship netrc
         netrc = os.path.join(get_user_files_path(), 'netrc')
         if os.path.exists(netrc):
             set_bar_desc(bar, 'Configuring netrc')
             execute(fab.copy, netrc, '.netrc', roles=[comp])
-            execute(fab.chmod, 600, '.netrc', roles=[comp])
+
+        # expose hysds log dir via webdav and secure netrc
+        set_bar_desc(bar, 'Expose logs')
+        with RemoteBatch(comp) as batch:
+            batch.mkdir('/data/work')
+            batch.ln_sf('~/verdi/log', '/data/work/log')
+            if os.path.exists(netrc): batch.chmod(600, '.netrc')
+        bar.update()
 
         # ship AWS creds
         set_bar_desc(bar, 'Configuring AWS creds')
@@ -520,40 +567,137 @@ def update_verdi(conf, ndeps=False, comp='verdi'):
         set_bar_desc(bar, 'Updated verdi')
 
 
-def update_comp(comp, conf, ndeps=False):
+# update functions and the components each one must wait for in parallel mode
+UPDATE_FUNCS = OrderedDict([
+    ('grq', update_grq),
+    ('mozart', update_mozart),
+    ('metrics', update_metrics),
+    ('factotum', update_factotum),
+    ('verdi', update_verdi),
+])
+UPDATE_DEPS = {
+    'grq': [],
+    'mozart': ['grq'],  # grq ES templates must be installed first
+    'metrics': [],
+    'factotum': [],
+    'verdi': [],
+}
+
+
+# seconds between checks that worker processes are still alive
+WORKER_POLL = 5
+
+
+def wait_for_result(results, running):
+    """Return (name, error) of the next worker in running to finish; a worker
+       that dies without reporting a result is returned as a failure."""
+
+    while True:
+        try: return results.get(timeout=WORKER_POLL)
+        except Empty: pass
+        for name, p in running.items():
+            if p.is_alive(): continue
+
+            # the result of a worker that just exited may still be in flight
+            try: return results.get(timeout=WORKER_POLL)
+            except Empty:
+                return name, "Worker exited with code {} without reporting a result.".format(p.exitcode)
+
+
+def run_update(comp, conf, ndeps, incremental, wheelhouse, position, results):
+    """Run component update in child process and report result."""
+
+    try:
+        UPDATE_FUNCS[comp](conf, ndeps, position=position, incremental=incremental,
+                           wheelhouse=wheelhouse)
+        results.put((comp, None))
+    except BaseException:
+        results.put((comp, traceback.format_exc()))
+
+
+def update_comps_parallel(conf, ndeps=False, incremental=False, wheelhouse=False):
+    """Update all components in parallel, respecting UPDATE_DEPS ordering."""
+
+    results = Queue()
+    pending = list(UPDATE_FUNCS.keys())
+    running = {}
+    errors = {}
+    done = set()
+    while len(pending) > 0 or len(running) > 0:
+
+        # skip components whose dependencies failed
+        for comp in list(pending):
+            failed = [i for i in UPDATE_DEPS[comp] if i in errors]
+            if len(failed) > 0:
+                errors[comp] = "Skipped because {} failed.".format(", ".join(failed))
+                pending.remove(comp)
+
+        # start components whose dependencies are done
+        for comp in list(pending):
+            if all(i in done for i in UPDATE_DEPS[comp]):
+                p = Process(target=run_update, args=(comp, conf, ndeps, incremental,
+                            wheelhouse, list(UPDATE_FUNCS.keys()).index(comp), results))
+                p.start()
+                running[comp] = p
+                pending.remove(comp)
+
+        # wait for next component to finish
+        if len(running) == 0: break
+        comp, error = wait_for_result(results, running)
+        running.pop(comp).join()
+        if error is None: done.add(comp)
+        else: errors[comp] = error
+
+    # error report
+    print("\n" * len(UPDATE_FUNCS))
+    for comp in UPDATE_FUNCS:
+        if comp in errors:
+            print("{}: {}".format(comp, blink(highlight("FAILED", 'red'))))
+            print(errors[comp])
+        else: print("{}: {}".format(comp, highlight("UPDATED")))
+    if len(errors) > 0:
+        raise RuntimeError("Failed to update component[s]: {}".format(
+                           ", ".join(i for i in UPDATE_FUNCS if i in errors)))
+
+
+def update_comp(comp, conf, ndeps=False, parallel=False, incremental=False,
+                wheelhouse=False):
     """Update component."""
 
     # if all, create progress bar
-    if comp == 'all':
+    if comp == 'all' and parallel:
+        update_comps_parallel(conf, ndeps, incremental, wheelhouse)
+    elif comp == 'all':
     
         # progress bar
         with tqdm(total=5) as bar:
             set_bar_desc(bar, "Updating grq")
-            update_grq(conf, ndeps)
+            update_grq(conf, ndeps, incremental=incremental, wheelhouse=wheelhouse)
             bar.update()
             set_bar_desc(bar, "Updating mozart")
-            update_mozart(conf, ndeps)
+            update_mozart(conf, ndeps, incremental=incremental, wheelhouse=wheelhouse)
             bar.update()
             set_bar_desc(bar, "Updating metrics")
-            update_metrics(conf, ndeps)
+            update_metrics(conf, ndeps, incremental=incremental, wheelhouse=wheelhouse)
             bar.update()
             set_bar_desc(bar, "Updating factotum")
-            update_factotum(conf, ndeps)
+            update_factotum(conf, ndeps, incremental=incremental, wheelhouse=wheelhouse)
             bar.update()
             set_bar_desc(bar, "Updating verdi")
-            update_verdi(conf, ndeps)
+            update_verdi(conf, ndeps, incremental=incremental, wheelhouse=wheelhouse)
             bar.update()
             set_bar_desc(bar, "Updated all")
             print("")
     else:
-        if comp == 'grq': update_grq(conf, ndeps)
-        if comp == 'mozart': update_mozart(conf, ndeps)
-        if comp == 'metrics': update_metrics(conf, ndeps)
-        if comp == 'factotum': update_factotum(conf, ndeps)
-        if comp == 'verdi': update_verdi(conf, ndeps)
+        if comp == 'grq': update_grq(conf, ndeps, incremental=incremental, wheelhouse=wheelhouse)
+        if comp == 'mozart': update_mozart(conf, ndeps, incremental=incremental, wheelhouse=wheelhouse)
+        if comp == 'metrics': update_metrics(conf, ndeps, incremental=incremental, wheelhouse=wheelhouse)
+        if comp == 'factotum': update_factotum(conf, ndeps, incremental=incremental, wheelhouse=wheelhouse)
+        if comp == 'verdi': update_verdi(conf, ndeps, incremental=incremental, wheelhouse=wheelhouse)
 
 
-def update(comp, debug=False, force=False, ndeps=False):
+def update(comp, debug=False, force=False, ndeps=False, parallel=False, incremental=False,
+           wheelhouse=False):
     """Update components."""
 
     # prompt user
@@ -568,20 +712,62 @@ def update(comp, debug=False, force=False, ndeps=False):
 
     logger.debug("Updating %s" % comp)
 
-    if debug: update_comp(comp, conf, ndeps)
+    if debug: update_comp(comp, conf, ndeps, parallel, incremental, wheelhouse)
     else:
         with hide('everything'):
-            update_comp(comp, conf, ndeps)
+            update_comp(comp, conf, ndeps, parallel, incremental, wheelhouse)
+
+
+# number of queue bundles built and shipped concurrently
+SHIP_JOBS = 4
+
+
+def ship_queue(conf, queue, encrypt, comp, base_bundle, codec, level, position, results):
+    """Stage, bundle and ship a queue's verdi bundle in child process and report result;
+       if base bundle (url, sha1) is set, the queue bundle is an overlay of configs only."""
+
+    # the AMI bootstrap fetches queue bundles as .tbz2, so only bzip2 codecs apply
+    if codec != 'pbzip2': codec, level = 'bzip2', None
+    try:
+        stage_dir = fab.get_queue_stage_dir(queue)
+        base_url, base_sha1 = base_bundle or ('', '')
+        tar_file = '~/{}-{}{}'.format(queue, conf.get('VENUE'), fab.get_bundle_ext(codec))
+        with tqdm(total=3, position=position) as bar:
+
+            # stage code, config and creds in queue's own tree
+            set_bar_desc(bar, 'Staging {} queue'.format(queue))
+            execute(fab.stage_queue_bundle, queue, base_bundle is None, roles=[comp])
+            bar.update()
+
+            # send queue-specific install.sh script and configs
+            set_bar_desc(bar, 'Sending {} queue config'.format(queue))
+            execute(fab.send_queue_config, queue, stage_dir, base_url, base_sha1, roles=[comp])
+            bar.update()
 
+            # create venue bundle
+            set_bar_desc(bar, 'Creating/shipping {} bundle'.format(queue))
+            execute(fab.ship_code, stage_dir, tar_file, encrypt, codec, level, roles=[comp])
+            execute(fab.rm_rf, stage_dir, roles=[comp])
+            bar.update()
+            set_bar_desc(bar, 'Shipped {} queue'.format(queue))
+        results.put((queue, None))
+    except BaseException:
+        results.put((queue, traceback.format_exc()))
 
-def ship_verdi(conf, encrypt=False, comp='ci'):
+
+def ship_verdi(conf, encrypt=False, comp='ci', jobs=SHIP_JOBS, codec='bzip2', level=None):
     """"Ship verdi code/config bundle."""
 
-    venue = conf.get('VENUE')
-    queues = [i.strip() for i in conf.get('QUEUES').split()]
+    queues = list(OrderedDict.fromkeys(i.strip() for i in conf.get('QUEUES').split()))
+
+    # ship code once in a base bundle if install.sh can fetch it, otherwise in every queue bundle
+    with open(os.path.join(get_user_files_path(), 'install.sh')) as f:
+        layered = 'BASE_BUNDLE_URL' in f.read()
+    if not layered:
+        logger.warning("install.sh doesn't fetch BASE_BUNDLE_URL; shipping code in every queue bundle.")
 
     # progress bar
-    with tqdm(total=len(queues)+2) as bar:
+    with tqdm(total=len(queues)+3) as bar:
 
         # ensure venv
         set_bar_desc(bar, 'Ensuring HySDS venv')
@@ -594,68 +780,70 @@ def ship_verdi(conf, encrypt=False, comp='ci'):
         execute(fab.kill_hung, roles=[comp])
         bar.update()
 
-        # iterate over queues
-        for queue in queues:
-
-            set_bar_desc(bar, 'Shipping {} queue'.format(queue))
-
-            # progress bar
-            with tqdm(total=5) as queue_bar:
-
-                # send queue-specific install.sh script and configs
-                set_bar_desc(queue_bar, 'Sending queue-specific config')
-                execute(fab.rm_rf, '~/verdi/ops/install.sh', roles=[comp])
-                execute(fab.rm_rf, '~/verdi/etc/datasets.json', roles=[comp])
-                execute(fab.rm_rf, '~/verdi/etc/supervisord.conf', roles=[comp])
-                execute(fab.rm_rf, '~/verdi/etc/supervisord.conf.tmpl', roles=[comp])
-                execute(fab.send_queue_config, queue, roles=[comp])
-                execute(fab.chmod, '755', '~/verdi/ops/install.sh', roles=[comp])
-                execute(fab.chmod, '644', '~/verdi/etc/datasets.json', roles=[comp])
-                queue_bar.update()
-
-                # copy config
-                set_bar_desc(queue_bar, 'Copying config')
-                execute(fab.rm_rf, '~/verdi/ops/etc', roles=[comp])
-                execute(fab.cp_rp, '~/verdi/etc', '~/verdi/ops/', roles=[comp])
-                queue_bar.update()
-
-                # copy creds
-                set_bar_desc(queue_bar, 'Copying creds')
-                execute(fab.rm_rf, '~/verdi/ops/creds', roles=[comp])
-                execute(fab.mkdir, '~/verdi/ops/creds', 'ops', 'ops', roles=[comp])
-                execute(fab.cp_rp_exists, '~/.netrc', '~/verdi/ops/creds/', roles=[comp])
-                execute(fab.cp_rp_exists, '~/.boto', '~/verdi/ops/creds/', roles=[comp])
-                execute(fab.cp_rp_exists, '~/.s3cfg', '~/verdi/ops/creds/', roles=[comp])
-                execute(fab.cp_rp_exists, '~/.aws', '~/verdi/ops/creds/', roles=[comp])
-                queue_bar.update()
-
-                # send work directory stylesheets
-                style_tar = os.path.join(get_user_files_path(), 'beefed-autoindex-open_in_new_win.tbz2')
-                set_bar_desc(queue_bar, 'Sending work dir stylesheets')
-                execute(fab.rm_rf, '~/verdi/ops/beefed-autoindex-open_in_new_win.tbz2', roles=[comp])
-                execute(fab.copy, style_tar, '~/verdi/ops/beefed-autoindex-open_in_new_win.tbz2', roles=[comp])
-                queue_bar.update()
-
-                # create venue bundle
-                set_bar_desc(queue_bar, 'Creating/shipping bundle')
-                execute(fab.rm_rf, '~/{}-{}.tbz2'.format(queue, venue), roles=[comp])
-                execute(fab.ship_code, '~/verdi/ops', '~/{}-{}.tbz2'.format(queue, venue), encrypt, roles=[comp])
-                queue_bar.update()
+        # clear queue-specific files from ops dir and send work directory stylesheets
+        # once; the ops dir ships in the base bundle or is hard linked into each queue's tree
+        set_bar_desc(bar, 'Sending work dir stylesheets')
+        style_tar = os.path.join(get_user_files_path(), 'beefed-autoindex-open_in_new_win.tbz2')
+        with RemoteBatch(comp) as batch:
+            batch.rm_rf('~/verdi/ops/install.sh')
+            batch.rm_rf('~/verdi/ops/etc')
+            batch.rm_rf('~/verdi/ops/creds')
+            batch.rm_rf('~/verdi/ops/beefed-autoindex-open_in_new_win.tbz2')
+            batch.rm_rf('~/verdi/etc/supervisord.conf')
+            batch.rm_rf(fab.ship_dir)
+        execute(fab.copy, style_tar, '~/verdi/ops/beefed-autoindex-open_in_new_win.tbz2', roles=[comp])
+
+        # create base bundle shared by all queues
+        base_bundle = None
+        if layered:
+            set_bar_desc(bar, 'Creating/shipping base bundle')
+            base_tar = '~/verdi-base-{}{}'.format(conf.get('VENUE'), fab.get_bundle_ext(codec))
+            execute(fab.ship_code, '~/verdi/ops', base_tar, encrypt, codec, level, roles=[comp])
+            base_sha1 = list(execute(fab.get_sha1, base_tar, roles=[comp]).values())[0]
+            base_bundle = (fab.get_bundle_url(base_tar), base_sha1)
+        bar.update()
+
+        # bundle and ship queues concurrently
+        results = Queue()
+        pending = list(queues)
+        running = {}
+        errors = {}
+        while len(pending) > 0 or len(running) > 0:
+            while len(pending) > 0 and len(running) < max(jobs, 1):
+                queue = pending.pop(0)
+                set_bar_desc(bar, 'Shipping {} queue'.format(queue))
+                p = Process(target=ship_queue, args=(conf, queue, encrypt, comp, base_bundle,
+                            codec, level, queues.index(queue) + 1, results))
+                p.start()
+                running[queue] = p
+            queue, error = wait_for_result(results, running)
+            running.pop(queue).join()
+            if error is not None: errors[queue] = error
             bar.update()
         set_bar_desc(bar, 'Finished shipping')
-        print("")
+
+    # error report
+    print("\n" * len(queues))
+    for queue in queues:
+        if queue in errors:
+            print("{}: {}".format(queue, blink(highlight("FAILED", 'red'))))
+            print(errors[queue])
+        else: print("{}: {}".format(queue, highlight("SHIPPED")))
+    if len(errors) > 0:
+        raise RuntimeError("Failed to ship queue[s]: {}".format(
+                           ", ".join(i for i in queues if i in errors)))
 
 
-def ship(encrypt, debug=False):
+def ship(encrypt, debug=False, jobs=SHIP_JOBS, codec='bzip2', level=None):
     """Update components."""
 
     # get user's SDS conf settings
     conf = SettingsConf()
 
-    if debug: ship_verdi(conf, encrypt)
+    if debug: ship_verdi(conf, encrypt, jobs=jobs, codec=codec, level=level)
     else:
         with hide('everything'):
-            ship_verdi(conf, encrypt)
+            ship_verdi(conf, encrypt, jobs=jobs, codec=codec, level=level)
 
 def import_kibana(comp='metrics'):
     """"Update metrics component."""
@@ -0,0 +1,96 @@
+"""
+Wheelhouse management functions for HySDS.
+"""
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import print_function
+
+import os, glob, shutil, subprocess
+from fabric.api import hide
+
+from sdscli.log_utils import logger
+from sdscli.os_utils import validate_dir
+
+from . import fabfile as fab
+from .fabfile import execute
+
+
+# venv dir of each component
+VENV_DIRS = {
+    'mozart': 'mozart',
+    'metrics': 'metrics',
+    'grq': 'sciflo',
+    'factotum': 'verdi',
+    'verdi': 'verdi',
+}
+
+
+def get_pkg_dirs():
+    """Return HySDS package dirs under ~/mozart/ops including vendored third party ones."""
+
+    ops_dir = os.path.join(fab.ops_dir, 'mozart', 'ops')
+    setup_files = glob.glob(os.path.join(ops_dir, '*', 'setup.py'))
+    setup_files.extend(glob.glob(os.path.join(ops_dir, '*', 'third_party', '*', 'setup.py')))
+    return sorted(os.path.dirname(i) for i in setup_files)
+
+
+def get_venv_python(python=None):
+    """Return python of the mozart venv, which the other component venvs share
+       the python version and platform of, or the given interpreter."""
+
+    if python is not None: return os.path.expanduser(python)
+    return os.path.join(fab.ops_dir, 'mozart', 'bin', 'python')
+
+
+def build(args):
+    """Build wheelhouse of HySDS package dependencies.
+
+       Wheels are built with the component venvs' python rather than the one
+       running sds so compiled wheels get the ABI and platform tags the venvs
+       install with --no-index."""
+
+    fab.setup_env()
+
+    # build with the component venvs' python
+    python = get_venv_python(args.python)
+    if not os.path.isfile(python):
+        logger.error("Python {} doesn't exist. Pass the component venvs' python with --python.".format(python))
+        return 1
+
+    # clean out old wheels
+    if args.clean and os.path.isdir(fab.wheelhouse_dir):
+        logger.debug("Removing {}.".format(fab.wheelhouse_dir))
+        shutil.rmtree(fab.wheelhouse_dir)
+    validate_dir(fab.wheelhouse_dir)
+
+    # build wheels for all packages and their dependencies
+    pkg_dirs = get_pkg_dirs()
+    if len(pkg_dirs) == 0:
+        logger.error("No HySDS packages found under {}.".format(os.path.join(fab.ops_dir, 'mozart', 'ops')))
+        return 1
+    logger.debug("pkg_dirs: {}".format(pkg_dirs))
+    cmd = [python, '-m', 'pip', 'wheel', '--process-dependency-links',
+           '--wheel-dir', fab.wheelhouse_dir] + pkg_dirs
+    logger.debug("cmd: {}".format(" ".join(cmd)))
+    if subprocess.call(cmd) != 0:
+        logger.error("Failed to build wheelhouse {}.".format(fab.wheelhouse_dir))
+        return 1
+    print("Built wheelhouse {} with {} wheels.".format(fab.wheelhouse_dir,
+          len(glob.glob(os.path.join(fab.wheelhouse_dir, '*.whl')))))
+
+
+def ship(args):
+    """Ship wheelhouse to component venvs."""
+
+    fab.setup_env()
+
+    if not os.path.isdir(fab.wheelhouse_dir):
+        logger.error("Wheelhouse {} doesn't exist. Run 'sds wheelhouse build'.".format(fab.wheelhouse_dir))
+        return 1
+    comps = list(VENV_DIRS) if args.component == 'all' else [args.component]
+    for comp in comps:
+        logger.debug("Shipping wheelhouse to {}.".format(comp))
+        if args.debug: execute(fab.rsync_wheelhouse, VENV_DIRS[comp], roles=[comp])
+        else:
+            with hide('everything'):
+                execute(fab.rsync_wheelhouse, VENV_DIRS[comp], roles=[comp])
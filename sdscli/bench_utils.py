@@ -0,0 +1,85 @@
+"""
+Import-time benchmark of sds subcommands.
+
+Run with 'python -m sdscli.bench_utils' to check each subcommand's startup
+imports against STARTUP_BUDGET and the heavy modules it must not load.
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+
+import sys, json, subprocess
+
+
+# startup budget in seconds for importing a subcommand's modules
+STARTUP_BUDGET = 0.5
+
+# heavy dependencies tracked per subcommand
+HEAVY_MODULES = ['fabric', 'paramiko', 'osaka', 'kombu', 'redis', 'elasticsearch',
+                 'boto3', 'tqdm', 'prompt_toolkit.shortcuts']
+
+# modules imported by each subcommand and the heavy modules it must not load
+SUBCOMMANDS = [
+    ('help', ['sdscli.command_line'], HEAVY_MODULES),
+    ('pkg', ['sdscli.command_line', 'sdscli.adapters.hysds.pkg'], HEAVY_MODULES),
+    ('rules', ['sdscli.command_line', 'sdscli.adapters.hysds.rules'], HEAVY_MODULES),
+    ('cloud', ['sdscli.command_line', 'sdscli.adapters.hysds.cloud'],
+     ['fabric', 'paramiko', 'osaka', 'kombu', 'redis', 'elasticsearch', 'tqdm']),
+    ('status', ['sdscli.command_line', 'sdscli.adapters.hysds.status'],
+     ['osaka', 'kombu', 'redis', 'elasticsearch', 'boto3', 'tqdm']),
+]
+
+# code run in a fresh interpreter to time the imports
+PROBE_CODE = """
+import sys, json, time
+t0 = time.time()
+for mod in {mods!r}: __import__(mod)
+elapsed = time.time() - t0
+print(json.dumps({{"elapsed": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def time_imports(mods, heavy=HEAVY_MODULES):
+    """Import modules in a fresh interpreter and return tuple of (seconds, heavy modules loaded)."""
+
+    code = PROBE_CODE.format(mods=list(mods), heavy=list(heavy))
+    out = subprocess.check_output([sys.executable, '-c', code])
+    res = json.loads(out.strip().splitlines()[-1])
+    return res['elapsed'], res['loaded']
+
+
+def run_benchmark(budget=STARTUP_BUDGET, repeat=3):
+    """Benchmark subcommand startup imports and return list of failures."""
+
+    failures = []
+    for name, mods, forbidden in SUBCOMMANDS:
+        times = []
+        try:
+            for i in range(repeat):
+                elapsed, loaded = time_imports(mods)
+                times.append(elapsed)
+        except subprocess.CalledProcessError:
+            print("{:<8} {:>9}  {}".format(name, "-", "import failed"))
+            failures.append("{}: failed to import {}".format(name, ", ".join(mods)))
+            continue
+        best = min(times)
+        bad = [m for m in loaded if m in forbidden]
+        status = "ok"
+        if best > budget:
+            status = "over budget"
+            failures.append("{}: {:.3f}s exceeds budget of {:.3f}s".format(name, best, budget))
+        if len(bad) > 0:
+            status = "loads {}".format(", ".join(bad))
+            failures.append("{}: loads {}".format(name, ", ".join(bad)))
+        print("{:<8} {:>8.3f}s  {}".format(name, best, status))
+    return failures
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else STARTUP_BUDGET
+    failures = run_benchmark(budget)
+    for f in failures: print(f, file=sys.stderr)
+    return 1 if len(failures) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
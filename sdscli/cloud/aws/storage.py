@@ -5,7 +5,6 @@ import os, re, json, boto3, hashlib, base64
 from pprint import pformat
 from collections import OrderedDict
 from operator import itemgetter
-from fabric.api import execute, hide
 
 from prompt_toolkit.shortcuts import prompt, print_tokens
 from prompt_toolkit.styles import style_from_dict
@@ -22,8 +21,6 @@ print_component_header)
 from .utils import *
 from .asg import prompt_secgroup
 
-from osaka.main import put
-
 
 prompt_style = style_from_dict({
     Token.Alert: 'bg:#D8060C',
@@ -65,6 +62,7 @@ def ship_style(args, conf):
 
     # get fab function
     func = get_func('sdscli.adapters.{}.fabfile'.format(args.type), args.subparser2)
+    execute = get_func('sdscli.adapters.{}.fabfile'.format(args.type), 'execute')
 
     # execute
     execute(func, bucket_name, args.encrypt, roles=['mozart']) 
@@ -174,10 +172,12 @@ def create_staging_area(args, conf):
     # create lambda zip file and upload to code bucket
     zip_file = "/tmp/data-staged.zip"
     func = get_func('sdscli.adapters.{}.fabfile'.format(args.type), 'create_zip')
+    execute = get_func('sdscli.adapters.{}.fabfile'.format(args.type), 'execute')
     if args.debug:
         execute(func, "mozart/ops/hysds-cloud-functions/aws/data-staged", 
                 zip_file, roles=['mozart'])
     else:
+        from fabric.api import hide
         with hide('everything'):
             execute(func, "mozart/ops/hysds-cloud-functions/aws/data-staged", 
                     zip_file, roles=['mozart'])
@@ -4,8 +4,7 @@ SDSKit command line interface.
 from __future__ import absolute_import
 from __future__ import print_function
 
-import os, sys, importlib, json, yaml, traceback, argparse, logging
-from importlib import import_module
+import os, sys, argparse, logging
 
 import sdscli
 from sdscli.func_utils import get_module, get_func
@@ -55,10 +54,22 @@ def update(args):
     logger.debug("sds_type: %s" % sds_type)
     func = get_adapter_func(sds_type, 'update', 'update') 
     logger.debug("func: %s" % func)
-    func(args.component, args.debug, args.force, args.ndeps)
+    func(args.component, args.debug, args.force, args.ndeps, args.parallel,
+         args.incremental, args.wheelhouse)
 
 
 
+def wheelhouse(args):
+    """SDS wheelhouse management functions."""
+
+    logger.debug("got to wheelhouse(): %s" % args)
+    sds_type = args.type
+    logger.debug("sds_type: %s" % sds_type)
+    func = get_adapter_func(sds_type, 'wheelhouse', args.subparser)
+    logger.debug("func: %s" % func)
+    return func(args)
+
+
 def ship(args):
     """Ship verdi code/config bundle."""
 
@@ -67,7 +78,7 @@ def ship(args):
     logger.debug("sds_type: %s" % sds_type)
     func = get_adapter_func(sds_type, 'update', 'ship') 
     logger.debug("func: %s" % func)
-    func(args.encrypt, args.debug)
+    func(args.encrypt, args.debug, args.jobs, args.codec, args.level)
 
 
 def start_tps(args):
@@ -133,7 +144,7 @@ def status(args):
     logger.debug("sds_type: %s" % sds_type)
     func = get_adapter_func(sds_type, 'status', 'status') 
     logger.debug("func: %s" % func)
-    func(args.component, args.debug)
+    func(args.component, args.debug, args.timeout, args.format, args.watch, args.direct)
 
 
 def ci(args):
@@ -155,7 +166,7 @@ def pkg(args):
     logger.debug("sds_type: %s" % sds_type)
     func = get_adapter_func(sds_type, 'pkg', 'import_pkg' if args.subparser == 'import' else args.subparser)
     logger.debug("func: %s" % func)
-    func(args)
+    return func(args)
 
 
 def cloud(args):
@@ -177,7 +188,7 @@ def rules(args):
     logger.debug("sds_type: %s" % sds_type)
     func = get_adapter_func(sds_type, 'rules', 'import_rules' if args.subparser == 'import' else args.subparser)
     logger.debug("func: %s" % func)
-    func(args)
+    return func(args)
 
 
 def job_list(args):
@@ -224,8 +235,32 @@ def main():
                              help="force update without user confirmation")
     parser_update.add_argument('--ndeps', '-n', action='store_true',
                              help="skip the external accesses for dependencies")
+    parser_update.add_argument('--parallel', '-p', action='store_true',
+                             help="update independent components in parallel when updating all")
+    parser_update.add_argument('--incremental', '-i', action='store_true',
+                             help="sync code incrementally, skipping repos unchanged since last update")
+    parser_update.add_argument('--wheelhouse', '-w', action='store_true',
+                             help="ship the wheelhouse and install dependencies only from it")
     parser_update.set_defaults(func=update)
 
+    # parser for wheelhouse
+    parser_wheelhouse = subparsers.add_parser('wheelhouse', help="SDS dependency wheelhouse management")
+    parser_wheelhouse.add_argument('--type', '-t', default='hysds', const='hysds', nargs='?',
+                                   choices=['hysds', 'sdskit'])
+    parser_wheelhouse_subparsers = parser_wheelhouse.add_subparsers(dest='subparser',
+                                                                    help='SDS wheelhouse management functions')
+    parser_wheelhouse_build = parser_wheelhouse_subparsers.add_parser('build',
+                                                                      help="build wheelhouse from ~/mozart/ops packages")
+    parser_wheelhouse_build.add_argument('--clean', '-c', action='store_true',
+                                         help="remove existing wheels before building")
+    parser_wheelhouse_build.add_argument('--python', '-p', default=None,
+                                         help="python of the component venvs to build wheels with " +
+                                              "(default: ~/mozart/bin/python)")
+    parser_wheelhouse_ship = parser_wheelhouse_subparsers.add_parser('ship', help="ship wheelhouse to SDS components")
+    parser_wheelhouse_ship.add_argument('component', default='all', const='all', nargs='?',
+                                        choices=['mozart', 'grq', 'metrics', 'factotum', 'verdi', 'all'])
+    parser_wheelhouse.set_defaults(func=wheelhouse)
+
     # parser for kibana
     parser_update = subparsers.add_parser('kibana', help="update SDS components")
     parser_update.add_argument('--type', '-t', default='hysds', const='hysds', nargs='?',
@@ -242,6 +277,12 @@ def main():
                                   choices=['hysds', 'sdskit'])
     parser_ship.add_argument('--encrypt', '-e', action='store_true',
                              help="encrypt code/config bundle")
+    parser_ship.add_argument('--jobs', '-j', type=int, default=4,
+                             help="number of queue bundles to build and ship concurrently")
+    parser_ship.add_argument('--codec', '-c', default='bzip2', choices=['bzip2', 'pbzip2', 'pigz', 'zstd'],
+                             help="compression of the base bundle; queue bundles use bzip2 unless pbzip2")
+    parser_ship.add_argument('--level', '-l', type=int, default=None,
+                             help="compression level (default: codec's default)")
     parser_ship.set_defaults(func=ship)
 
     # parser for start_tps
@@ -300,6 +341,18 @@ def main():
                                choices=['hysds', 'sdskit'])
     parser_status.add_argument('component', default='all', const='all', nargs='?',
                                choices=['mozart', 'grq', 'metrics', 'factotum', 'ci', 'verdi', 'all'])
+    parser_status.add_argument('--timeout', '-T', type=int, default=30,
+                               help="seconds to wait for each status probe")
+    parser_status.add_argument('--watch', '-w', type=int, default=None, metavar='N',
+                               help="re-poll status every N seconds over persistent connections")
+    parser_status.add_argument('--direct', '-D', action='store_true',
+                               help="probe RabbitMQ, redis, ES and Jenkins directly instead of over SSH; " +
+                                    "services not reachable from this host are probed over SSH")
+    parser_status_format = parser_status.add_mutually_exclusive_group()
+    parser_status_format.add_argument('--json', dest='format', action='store_const', const='json',
+                                      default='text', help="print status as a JSON document")
+    parser_status_format.add_argument('--ndjson', dest='format', action='store_const', const='ndjson',
+                                      help="stream status as newline-delimited JSON records")
     parser_status.set_defaults(func=status)
 
     # parser for ci
@@ -327,8 +380,21 @@ def main():
     parser_pkg_export.add_argument('--outdir', '-o', default=".",
                                    help="root output directory of SDS package")
     parser_pkg_export.add_argument('--accounts', '-a', action='store_true', help="save allowed accounts")
+    parser_pkg_export.add_argument('--jobs', '-j', type=int, default=4,
+                                   help="number of concurrent image downloads")
+    parser_pkg_export.add_argument('--stream', '-s', action='store_true',
+                                   help="stream images into the archive without a staging directory")
+    parser_pkg_export.add_argument('--compress', '-c', default=None, choices=['gz', 'zst'],
+                                   help="compress streamed archive (implies --stream)")
+    parser_pkg_export.add_argument('--output', '-O', default=None,
+                                   help="archive file path, '-' for stdout or s3:// url (implies --stream)")
+    parser_pkg_export.add_argument('--cache', action='store_true',
+                                   help="reuse and populate the local image cache, which keeps " +
+                                        "a copy of each image under ~/.sds/cache")
     parser_pkg_import = parser_pkg_subparsers.add_parser('import', help="import SDS package")
-    parser_pkg_import.add_argument('file', help='SDS package to import')
+    parser_pkg_import.add_argument('file', help="SDS package to import or '-' for stdin")
+    parser_pkg_import.add_argument('--jobs', '-j', type=int, default=4,
+                                   help="number of concurrent image uploads")
     parser_pkg_rm = parser_pkg_subparsers.add_parser('rm', help="remove SDS package")
     parser_pkg_rm.add_argument('id', help='SDS package id to remove')
     parser_pkg.set_defaults(func=pkg)
@@ -1,10 +1,22 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
-import os, yaml, logging, traceback
+import os, copy, yaml, logging, traceback, hashlib
+import cPickle as pickle
 
 from sdscli.log_utils import logger
 
+# use libyaml-backed loader when available
+try: from yaml import CSafeLoader as SafeLoader
+except ImportError: from yaml import SafeLoader
+
+
+# parsed YAML configs keyed by path: (mtime, size, cfg)
+_yaml_cache = {}
+
+# write pickled sidecars of parsed configs under the user cache
+YAML_SIDECAR = True
+
 
 def get_user_config_path():
     """Return path to user configuration."""
@@ -18,6 +30,67 @@ def get_user_files_path():
     return os.path.expanduser(os.path.join('~', '.sds', 'files'))
 
 
+def get_user_cache_path():
+    """Return path to user cache."""
+
+    return os.path.expanduser(os.path.join('~', '.sds', 'cache'))
+
+
+def get_yaml_sidecar_path(path):
+    """Return path to pickled sidecar of parsed YAML config."""
+
+    return os.path.join(get_user_cache_path(), 'conf',
+                        "{}.pickle".format(hashlib.sha1(path.encode('utf-8')).hexdigest()))
+
+
+def read_yaml_sidecar(path, key):
+    """Return parsed config from sidecar if it matches key, otherwise None."""
+
+    try:
+        with open(get_yaml_sidecar_path(path), 'rb') as f:
+            cached_key, cfg = pickle.load(f)
+    except Exception:
+        return None
+    return cfg if cached_key == key else None
+
+
+def write_yaml_sidecar(path, key, cfg):
+    """Write parsed config to sidecar, ignoring failures."""
+
+    sidecar = get_yaml_sidecar_path(path)
+    tmp = "{}.{}".format(sidecar, os.getpid())
+    try:
+        if not os.path.isdir(os.path.dirname(sidecar)):
+            os.makedirs(os.path.dirname(sidecar), 0700)
+        # sidecars hold credentials from the config so keep them private
+        with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600), 'wb') as f:
+            pickle.dump((key, cfg), f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, sidecar)
+    except Exception, e:
+        logger.debug("Failed to write config sidecar {}: {}".format(sidecar, e))
+        if os.path.exists(tmp): os.unlink(tmp)
+
+
+def load_yaml(path):
+    """Return parsed YAML config, cached per process and in a sidecar until
+       the file's mtime or size changes. Each call gets its own deep copy."""
+
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    key = (st.st_mtime, st.st_size)
+    cached = _yaml_cache.get(path, None)
+    if cached is not None and cached[0] == key: return copy.deepcopy(cached[1])
+    cfg = read_yaml_sidecar(path, key) if YAML_SIDECAR else None
+    if cfg is None:
+        logger.debug("Parsing {}.".format(path))
+        with open(path) as f:
+            cfg = yaml.load(f, Loader=SafeLoader)
+        if cfg is None: cfg = {}
+        if YAML_SIDECAR: write_yaml_sidecar(path, key, cfg)
+    _yaml_cache[path] = (key, cfg)
+    return copy.deepcopy(cfg)
+
+
 class YamlConfError(Exception):
     """Exception class for YamlConf class."""
     pass
@@ -31,8 +104,7 @@ class YamlConf(object):
 
         logger.debug("file: {}".format(file))
         self._file = file
-        with open(self._file) as f:
-            self._cfg = yaml.load(f)
+        self._cfg = load_yaml(self._file)
 
     @property
     def file(self):
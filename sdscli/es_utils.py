@@ -0,0 +1,165 @@
+from __future__ import unicode_literals
+from __future__ import absolute_import
+from __future__ import print_function
+
+import json, threading, requests
+from urlparse import urlparse
+from requests.adapters import HTTPAdapter
+
+from sdscli.log_utils import logger
+
+
+# connection pool settings
+ES_POOL_SIZE = 10
+ES_CONNECT_TIMEOUT = 10
+ES_READ_TIMEOUT = 300
+
+# keep-alive sessions keyed by ES host
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_es_host(url):
+    """Return scheme and network location of ES url."""
+
+    u = urlparse(url)
+    return "{}://{}".format(u.scheme, u.netloc)
+
+
+def get_session(url, pool_size=None):
+    """Return keep-alive session for the ES host of url, creating it on first use."""
+
+    host = get_es_host(url)
+    with _sessions_lock:
+        session = _sessions.get(host, None)
+        if session is None:
+            if pool_size is None: pool_size = ES_POOL_SIZE
+            logger.debug("Creating ES session for {} with pool size {}.".format(host, pool_size))
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("{}/".format(host), adapter)
+            _sessions[host] = session
+        return session
+
+
+def close_sessions():
+    """Close all ES sessions."""
+
+    with _sessions_lock:
+        for host, session in _sessions.items():
+            logger.debug("Closing ES session for {}.".format(host))
+            session.close()
+        _sessions.clear()
+
+
+def configure(pool_size=None, connect_timeout=None, read_timeout=None):
+    """Override ES connection pool size and timeouts."""
+
+    global ES_POOL_SIZE, ES_CONNECT_TIMEOUT, ES_READ_TIMEOUT
+    if pool_size is not None: ES_POOL_SIZE = pool_size
+    if connect_timeout is not None: ES_CONNECT_TIMEOUT = connect_timeout
+    if read_timeout is not None: ES_READ_TIMEOUT = read_timeout
+    close_sessions()
+
+
+def configure_from_settings(conf):
+    """Apply optional ES_POOL_SIZE, ES_CONNECT_TIMEOUT and ES_READ_TIMEOUT settings."""
+
+    configure(conf.cfg.get('ES_POOL_SIZE', None),
+              conf.cfg.get('ES_CONNECT_TIMEOUT', None),
+              conf.cfg.get('ES_READ_TIMEOUT', None))
+
+
+def request(method, url, **kwargs):
+    """Issue request to ES over pooled keep-alive session."""
+
+    kwargs.setdefault('timeout', (ES_CONNECT_TIMEOUT, ES_READ_TIMEOUT))
+    return get_session(url).request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    """GET request to ES."""
+
+    return request('GET', url, **kwargs)
+
+
+def post(url, data=None, **kwargs):
+    """POST request to ES."""
+
+    return request('POST', url, data=data, **kwargs)
+
+
+def put(url, data=None, **kwargs):
+    """PUT request to ES."""
+
+    return request('PUT', url, data=data, **kwargs)
+
+
+def delete(url, **kwargs):
+    """DELETE request to ES."""
+
+    return request('DELETE', url, **kwargs)
+
+
+# bulk request limits
+BULK_MAX_DOCS = 500
+BULK_MAX_BYTES = 5 * 1024 * 1024
+
+
+def iter_bulk_chunks(actions, max_docs=None, max_bytes=None):
+    """Yield NDJSON bulk payloads chunked by document count and byte size.
+
+       Each action is a tuple of (index, doc_type, id, doc); id can be None
+       to let ES generate one. Yields tuples of (payload, metas) where metas
+       holds the action metadata of each document in the payload."""
+
+    if max_docs is None: max_docs = BULK_MAX_DOCS
+    if max_bytes is None: max_bytes = BULK_MAX_BYTES
+    lines = []
+    metas = []
+    size = 0
+    for idx, doc_type, id, doc in actions:
+        meta = { "_index": idx, "_type": doc_type }
+        if id is not None: meta['_id'] = id
+        item = "{}\n{}\n".format(json.dumps({ "index": meta }), json.dumps(doc)).encode('utf-8')
+        if len(lines) > 0 and (len(lines) >= max_docs or size + len(item) > max_bytes):
+            yield b"".join(lines), metas
+            lines = []
+            metas = []
+            size = 0
+        lines.append(item)
+        metas.append(meta)
+        size += len(item)
+    if len(lines) > 0:
+        yield b"".join(lines), metas
+
+
+def bulk_index(url, actions, max_docs=None, max_bytes=None):
+    """Index documents into ES using the bulk API.
+
+       Returns tuple of (indexed count, list of failed items)."""
+
+    count = 0
+    failures = []
+    for payload, metas in iter_bulk_chunks(actions, max_docs, max_bytes):
+        logger.debug("Sending bulk request of {} docs ({} bytes) to {}.".format(
+                     len(metas), len(payload), url))
+        r = post("{}/_bulk".format(url), data=payload)
+        r.raise_for_status()
+        res = r.json()
+        for meta, item in zip(metas, res['items']):
+            result = item.get('index', item.get('create', {}))
+            status = result.get('status', 200)
+            if 'error' in result or status >= 300:
+                failures.append({
+                    "_index": meta['_index'],
+                    "_type": meta['_type'],
+                    "_id": result.get('_id', meta.get('_id', None)),
+                    "status": status,
+                    "error": result.get('error', None),
+                })
+            else: count += 1
+    for f in failures:
+        logger.error("Failed to index {}/{}/{} ({}): {}".format(f['_index'], f['_type'],
+                     f['_id'], f['status'], f['error']))
+    return count, failures
@@ -1,7 +1,6 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
-import os, sys, importlib, json, yaml, traceback, argparse, logging
 from importlib import import_module
 
 from sdscli.log_utils import logger
@@ -1,7 +1,7 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
-import os
+import os, errno, hashlib
 
 from sdscli.log_utils import logger
 
@@ -36,3 +36,13 @@ def validate_dir(d, mode=0755, noExceptionRaise=False):
             if noExceptionRaise: pass
             else: raise
         return 1
+
+
+def sha256sum(path, blocksize=1024*1024):
+    """Return hex SHA-256 digest of file contents."""
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            h.update(block)
+    return h.hexdigest()
@@ -2,11 +2,13 @@ from __future__ import unicode_literals
 from __future__ import absolute_import
 from __future__ import print_function
 
-import os, sys, json, requests, logging, traceback, backoff
+import os, sys, json, logging, traceback, backoff
+from requests import RequestException
 from requests.packages.urllib3.exceptions import (InsecureRequestWarning,
                                                   InsecurePlatformWarning)
 
 from sdscli.log_utils import logger
+from sdscli import es_utils
 
 
 # backoff settings
@@ -61,11 +63,51 @@ def build_query(ands=None, ors=None, sort_order="desc"):
 
 
 @backoff.on_exception(backoff.expo,
-                      Exception,
+                      RequestException,
                       max_tries=BACKOFF_MAX_TRIES,
                       max_value=BACKOFF_MAX_VALUE)
-def run_query(url, idx, query, doc_type=None):
-    """Query ES index."""
+def start_scan(query_url, query):
+    """Start ES scan and return scroll id and total hits, retrying transient
+       request errors since no scroll cursor exists yet."""
+
+    r = es_utils.post(query_url, data=json.dumps(query))
+    r.raise_for_status()
+    scan_result = r.json()
+    logger.debug("total hits: {}".format(scan_result['hits']['total']))
+    return scan_result['_scroll_id'], scan_result['hits']['total']
+
+
+def scroll_page(url, scroll_id):
+    """Return next page of scroll results; not retried since ES may already
+       have moved the cursor past the page."""
+
+    r = es_utils.post('%s/_search/scroll?scroll=60m' % url, data=scroll_id)
+    r.raise_for_status()
+    return r.json()
+
+
+def iter_scroll(url, query_url, query):
+    """Yield hits from ES scan/scroll page by page, failing if the scroll
+       ends before all hits were returned.
+
+       The initial search is retried with backoff so callers iterating hits
+       directly survive transient ES errors; scroll pages are not retried."""
+
+    scroll_id, total = start_scan(query_url, query)
+    count = 0
+    while True:
+        res = scroll_page(url, scroll_id)
+        scroll_id = res['_scroll_id']
+        if len(res['hits']['hits']) == 0: break
+        for hit in res['hits']['hits']:
+            count += 1
+            yield hit
+    if count != total:
+        raise RuntimeError("ES scroll returned {} of {} hits.".format(count, total))
+
+
+def iter_query(url, idx, query, doc_type=None):
+    """Query ES index and yield hits as each scroll page arrives."""
 
     if doc_type is None:
         query_url = "{}/{}/_search?search_type=scan&scroll=60&size=100".format(url, idx)
@@ -75,27 +117,21 @@ def run_query(url, idx, query, doc_type=None):
     logger.info("idx: {}".format(idx))
     logger.info("doc_type: {}".format(doc_type))
     logger.info("query: {}".format(json.dumps(query, indent=2)))
-    r = requests.post(query_url, data=json.dumps(query))
-    r.raise_for_status()
-    scan_result = r.json()
-    count = scan_result['hits']['total']
-    scroll_id = scan_result['_scroll_id']
-    hits = []
-    while True:
-        r = requests.post('%s/_search/scroll?scroll=60m' % url, data=scroll_id)
-        res = r.json()
-        scroll_id = res['_scroll_id']
-        if len(res['hits']['hits']) == 0: break
-        hits.extend(res['hits']['hits'])
-    return hits
+    return iter_scroll(url, query_url, query)
 
 
 @backoff.on_exception(backoff.expo,
                       Exception,
                       max_tries=BACKOFF_MAX_TRIES,
                       max_value=BACKOFF_MAX_VALUE)
-def query_dataset(url, idx, id, version=None, sort_order="desc"):
-    """Query dataset by id and version."""
+def run_query(url, idx, query, doc_type=None):
+    """Query ES index, retrying the whole scan on failure."""
+
+    return list(iter_query(url, idx, query, doc_type))
+
+
+def iter_dataset(url, idx, id, version=None, sort_order="desc"):
+    """Query dataset by id and version and yield hits as each scroll page arrives."""
 
     # get index name and url
     query_url = "{}/{}/_search?search_type=scan&scroll=60&size=100".format(url, idx)
@@ -136,17 +172,14 @@ def query_dataset(url, idx, id, version=None, sort_order="desc"):
         })
 
     logger.info("query: {}".format(json.dumps(query, indent=2)))
-    r = requests.post(query_url, data=json.dumps(query))
-    r.raise_for_status()
-    scan_result = r.json()
-    count = scan_result['hits']['total']
-    scroll_id = scan_result['_scroll_id']
-    hits = []
-    while True:
-        r = requests.post('%s/_search/scroll?scroll=60m' % url, data=scroll_id)
-        res = r.json()
-        scroll_id = res['_scroll_id']
-        if len(res['hits']['hits']) == 0: break
-        hits.extend(res['hits']['hits'])
+    return iter_scroll(url, query_url, query)
+
+
+@backoff.on_exception(backoff.expo,
+                      Exception,
+                      max_tries=BACKOFF_MAX_TRIES,
+                      max_value=BACKOFF_MAX_VALUE)
+def query_dataset(url, idx, id, version=None, sort_order="desc"):
+    """Query dataset by id and version, retrying the whole scan on failure."""
 
-    return hits
+    return list(iter_dataset(url, idx, id, version, sort_order))